@@ -18,13 +18,29 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
 import json
+import functools
 import random
 # random.seed(0)
 import argparse
-from langcodes import Language
-from utils.agent import Agent
+from concurrent.futures import ThreadPoolExecutor
+if __package__:
+    # imported as code.debate4tran (e.g. by service.py at the repo root)
+    from .utils.agent import Agent
+    from .utils import tracing
+    from .utils.deadline import Deadline, DeadlineExceededException
+    from .utils.token_budget import TokenBudget
+    from .utils.hedging import Hedger
+    from .utils.decision import ModeratorDecision
+    from .utils.model_router import ModelRouter, merge_role_stats, format_role_stats
+else:
+    from utils.agent import Agent
+    from utils import tracing
+    from utils.deadline import Deadline, DeadlineExceededException
+    from utils.token_budget import TokenBudget
+    from utils.hedging import Hedger
+    from utils.decision import ModeratorDecision
+    from utils.model_router import ModelRouter, merge_role_stats, format_role_stats
 from datetime import datetime
-from tqdm import tqdm
 
 NAME_LIST = [
     "Affirmative side",
@@ -32,9 +48,20 @@ NAME_LIST = [
     "Moderator",
 ]
 
+# player name -> role key used by per-role settings in the prompt config (e.g. "max_tokens")
+ROLE_KEYS = {
+    "Baseline": "baseline",
+    "Affirmative side": "affirmative",
+    "Negative side": "negative",
+    "Moderator": "moderator",
+    "Escalated Moderator": "moderator",
+    "Judge": "judge",
+}
+
 
 class DebatePlayer(Agent):
-    def __init__(self, model_name: str, name: str, temperature: float, openai_api_key: str, sleep_time: float) -> None:
+    def __init__(self, model_name: str, name: str, temperature: float, openai_api_key: str, sleep_time: float,
+                 **kwargs) -> None:
         """Create a player in the debate
 
         Args:
@@ -43,8 +70,10 @@ class DebatePlayer(Agent):
             temperature (float): higher values make the output more random, while lower values make it more focused and deterministic
             openai_api_key (str): As the parameter name suggests
             sleep_time (float): sleep because of rate limits
+            **kwargs: further Agent options (timeout, deadline, token_budget, hedger, on_message)
         """
-        super(DebatePlayer, self).__init__(model_name, name, temperature, sleep_time)
+        super(DebatePlayer, self).__init__(model_name, name, temperature, sleep_time, role=ROLE_KEYS.get(name),
+                                           **kwargs)
         self.openai_api_key = openai_api_key
 
 
@@ -56,8 +85,16 @@ class Debate:
                  save_file_dir: str = None,
                  openai_api_key: str = None,
                  prompts_path: str = None,
+                 prompts: dict = None,
                  max_round: int = 3,
-                 sleep_time: float = 0
+                 sleep_time: float = 0,
+                 deadline: float = None,
+                 call_timeout: float = None,
+                 token_budget: TokenBudget = None,
+                 router: ModelRouter = None,
+                 hedger: Hedger = None,
+                 base_candidates: int = None,
+                 on_turn=None
                  ) -> None:
         """Create a debate
 
@@ -68,8 +105,22 @@ class Debate:
             save_file_dir (str): dir path to json file
             openai_api_key (str): As the parameter name suggests
             prompts_path (str): prompts path (json file)
+            prompts (dict): prompts as a dict, instead of prompts_path (e.g. a config kept in memory by a service)
             max_round (int): maximum Rounds of Debate
             sleep_time (float): sleep because of rate limits
+            deadline (float): latency budget in seconds for the whole debate (base translation included);
+                when it runs out the debate falls back to the moderator verdict or the base translation
+            call_timeout (float): timeout in seconds for a single API call
+            token_budget (TokenBudget): per-role max_tokens budgets shared across debates (so learned budgets
+                carry over); defaults to the "max_tokens" entries of the prompt config
+            router (ModelRouter): per-role models and escalation; defaults to the "role_models" / "escalation"
+                entries of the prompt config, with model_name for the other roles
+            hedger (Hedger): hedged API calls, shared across debates so the latency history carries over;
+                defaults to the "hedging" entry of the prompt config (off unless enabled there)
+            base_candidates (int): base translations sampled in one request; with 2 or more distinct ones
+                the negative side starts from the second and both sides answer round 1 in parallel.
+                Defaults to "base_sampling.candidates" of the prompt config (1: single base translation)
+            on_turn: callback(player_name, answer) invoked after every answer, e.g. to stream the debate
         """
 
         self.model_name = model_name
@@ -79,6 +130,15 @@ class Debate:
         self.openai_api_key = openai_api_key
         self.max_round = max_round
         self.sleep_time = sleep_time
+        self.call_timeout = call_timeout
+        self.on_turn = on_turn
+        self.deadline = Deadline(deadline)
+        self.timed_out = False
+        self.players = []
+        self.baseline = None
+        self.neg_seed = None
+        self.mod_ans = {}
+        self.last_moderator_prompt = None
 
         # init save file
         now = datetime.now()
@@ -99,17 +159,45 @@ class Debate:
             "Reason": '',
             "Supported Side": '',
             'players': {},
+            'usage': {},
+            'latency': 0.0,
+            'slo_missed': False,
+            'escalated': False,
+            'moderator_decisions': [],
+            'role_stats': {},
         }
-        prompts = json.load(open(prompts_path))
+        if prompts is None:
+            prompts = json.load(open(prompts_path))
         self.save_file.update(prompts)
         self.init_prompt()
-
-        if self.save_file['base_translation'] == "":
-            self.create_base()
-
-        # creat&init agents
-        self.creat_agents()
-        self.init_agents()
+        self.token_budget = token_budget if token_budget is not None else TokenBudget.from_config(self.save_file)
+        self.router = router if router is not None else ModelRouter.from_config(self.save_file, model_name)
+        self.hedger = hedger if hedger is not None else Hedger.from_config(self.save_file)
+        base_sampling = self.save_file.get('base_sampling') or {}
+        self.base_candidates = base_candidates or base_sampling.get('candidates', 1)
+        self.base_temperature = base_sampling.get('temperature', 0.8)
+        self.decision = ModeratorDecision.from_config(self.save_file)
+
+        try:
+            if self.save_file['base_translation'] == "":
+                self.create_base()
+
+            # creat&init agents
+            self.creat_agents()
+            self.init_agents()
+        except DeadlineExceededException as e:
+            print(f"Warning: {e}")
+            self.timed_out = True
+
+    def new_player(self, name: str, model_name: str = None) -> DebatePlayer:
+        role = ROLE_KEYS.get(name)
+        model_name = model_name or self.router.model(role)
+        # players on another model (routed / escalated, e.g. a reasoner) have their own budget, uncapped unless configured
+        budget_key = f"{role}@{model_name}" if role and model_name != self.model_name else role
+        return DebatePlayer(model_name=model_name, name=name, temperature=self.temperature,
+                            openai_api_key=self.openai_api_key, sleep_time=self.sleep_time,
+                            timeout=self.call_timeout, deadline=self.deadline, token_budget=self.token_budget,
+                            hedger=self.hedger, on_message=self.on_turn, budget_key=budget_key)
 
     def init_prompt(self):
         def prompt_replace(key):
@@ -124,22 +212,33 @@ class Debate:
 
     def create_base(self):
         print(f"\n===== Translation Task =====\n{self.save_file['base_prompt']}\n")
-        agent = DebatePlayer(model_name=self.model_name, name='Baseline', temperature=self.temperature,
-                             openai_api_key=self.openai_api_key, sleep_time=self.sleep_time)
+        with tracing.span("baseline", cat="round"):
+            self._create_base()
+
+    def _create_base(self):
+        agent = self.new_player('Baseline')
         agent.add_event(self.save_file['base_prompt'])
-        base_translation = agent.ask()
+        if self.base_candidates > 1:
+            # several candidates from one request; the temperature has to be > 0 for them to differ
+            candidates = agent.ask(temperature=self.base_temperature, n=self.base_candidates)
+            distinct = list(dict.fromkeys(c.strip() for c in candidates if c and c.strip()))
+            base_translation = distinct[0] if distinct else candidates[0]
+            if len(distinct) > 1:
+                self.neg_seed = distinct[1]
+            self.save_file['base_candidates'] = candidates
+        else:
+            base_translation = agent.ask()
         agent.add_memory(base_translation)
         self.save_file['base_translation'] = base_translation
         self.save_file['affirmative_prompt'] = self.save_file['affirmative_prompt'].replace("##base_translation##",
                                                                                             base_translation)
         self.save_file['players'][agent.name] = agent.memory_lst
+        self.save_file['usage'][agent.name] = agent.usage
+        self.baseline = agent
 
     def creat_agents(self):
         # creates players
-        self.players = [
-            DebatePlayer(model_name=self.model_name, name=name, temperature=self.temperature,
-                         openai_api_key=self.openai_api_key, sleep_time=self.sleep_time) for name in NAME_LIST
-        ]
+        self.players = [self.new_player(name) for name in NAME_LIST]
         self.affirmative = self.players[0]
         self.negative = self.players[1]
         self.moderator = self.players[2]
@@ -152,21 +251,31 @@ class Debate:
 
         # start: first round debate, state opinions
         print(f"===== Debate Round-1 =====\n")
-        self.affirmative.add_event(self.save_file['affirmative_prompt'])
-        self.aff_ans = self.affirmative.ask()
-        self.affirmative.add_memory(self.aff_ans)
+        with tracing.span("round", cat="round", round=1):
+            self.first_round()
 
-        self.negative.add_event(self.save_file['negative_prompt'].replace('##aff_ans##', self.aff_ans))
-        self.neg_ans = self.negative.ask()
-        self.negative.add_memory(self.neg_ans)
+    def first_round(self):
+        self.affirmative.add_event(self.save_file['affirmative_prompt'])
+        seed_prompt = self.save_file.get('negative_seed_prompt')
+        if self.neg_seed is None or not seed_prompt:
+            # unseeded (or a prompt config from before seeding): the negative answers the affirmative
+            self.aff_ans = self.affirmative.ask()
+            self.affirmative.add_memory(self.aff_ans)
+
+            self.negative.add_event(self.save_file['negative_prompt'].replace('##aff_ans##', self.aff_ans))
+            self.neg_ans = self.negative.ask()
+            self.negative.add_memory(self.neg_ans)
+        else:
+            # each side defends its own base candidate, so the negative does not wait for the affirmative
+            self.negative.add_event(seed_prompt.replace('##neg_base##', self.neg_seed))
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                aff = pool.submit(tracing.bind(self.affirmative.ask))
+                neg = pool.submit(tracing.bind(self.negative.ask))
+                self.aff_ans, self.neg_ans = aff.result(), neg.result()
+            self.affirmative.add_memory(self.aff_ans)
+            self.negative.add_memory(self.neg_ans)
 
-        self.moderator.add_event(
-            self.save_file['moderator_prompt'].replace('##aff_ans##', self.aff_ans).replace('##neg_ans##',
-                                                                                            self.neg_ans).replace(
-                '##round##', 'first'))
-        self.mod_ans = self.moderator.ask()
-        self.moderator.add_memory(self.mod_ans)
-        self.mod_ans = eval(self.mod_ans)
+        self.moderate(1)
 
     def round_dct(self, num: int):
         dct = {
@@ -181,9 +290,10 @@ class Debate:
         save_file_path = os.path.join(self.save_file_dir, f"{id}.json")
 
         self.save_file['end_time'] = current_time
-        json_str = json.dumps(self.save_file, ensure_ascii=False, indent=4)
-        with open(save_file_path, 'w', encoding='utf-8') as f:
-            f.write(json_str)
+        with tracing.span("save", id=id):
+            json_str = json.dumps(self.save_file, ensure_ascii=False, indent=4)
+            with open(save_file_path, 'w', encoding='utf-8') as f:
+                f.write(json_str)
 
     def broadcast(self, msg: str):
         """Broadcast a message to all players. 
@@ -217,27 +327,35 @@ class Debate:
 
     def run(self):
 
+        try:
+            if not self.timed_out:
+                self.debate()
+        except DeadlineExceededException as e:
+            print(f"Warning: {e}")
+            self.timed_out = True
+        if self.timed_out:
+            self.degrade()
+
+        for player in self.players:
+            self.save_file['players'][player.name] = player.memory_lst
+            self.save_file['usage'][player.name] = player.usage
+        self.save_file['latency'] = round(self.deadline.elapsed(), 3)
+        players = self.players if self.baseline is None else [self.baseline] + self.players
+        self.save_file['role_stats'] = self.router.role_stats(players)
+
+    def debate(self):
         for round in range(self.max_round - 1):
 
             if self.mod_ans["debate_translation"] != '':
                 break
             else:
                 print(f"===== Debate Round-{round + 2} =====\n")
-                self.affirmative.add_event(self.save_file['debate_prompt'].replace('##oppo_ans##', self.neg_ans))
-                self.aff_ans = self.affirmative.ask()
-                self.affirmative.add_memory(self.aff_ans)
-
-                self.negative.add_event(self.save_file['debate_prompt'].replace('##oppo_ans##', self.aff_ans))
-                self.neg_ans = self.negative.ask()
-                self.negative.add_memory(self.neg_ans)
-
-                self.moderator.add_event(
-                    self.save_file['moderator_prompt'].replace('##aff_ans##', self.aff_ans).replace('##neg_ans##',
-                                                                                                    self.neg_ans).replace(
-                        '##round##', self.round_dct(round + 2)))
-                self.mod_ans = self.moderator.ask()
-                self.moderator.add_memory(self.mod_ans)
-                self.mod_ans = eval(self.mod_ans)
+                with tracing.span("round", cat="round", round=round + 2):
+                    self.debate_round(round + 2)
+
+        if self.mod_ans["debate_translation"] == '' and self.router.escalation_model("moderator"):
+            with tracing.span("escalate", cat="round"):
+                self.escalate()
 
         if self.mod_ans["debate_translation"] != '':
             self.save_file.update(self.mod_ans)
@@ -245,33 +363,158 @@ class Debate:
 
         # ultimate deadly technique.
         else:
-            judge_player = DebatePlayer(model_name=self.model_name, name='Judge', temperature=self.temperature,
-                                        openai_api_key=self.openai_api_key, sleep_time=self.sleep_time)
-            aff_ans = self.affirmative.memory_lst[2]['content']
-            neg_ans = self.negative.memory_lst[2]['content']
+            with tracing.span("judge", cat="round"):
+                self.judge()
+
+    def escalate(self):
+        """The moderator found no preference: ask its escalation model the same question once before the judge"""
+        player = self.new_player('Escalated Moderator', self.router.escalation_model("moderator"))
+        # the moderator's conversation without its undecided last verdict, asked for the full verdict on
+        # the last round (in two-step mode the last question may have been the short Yes/No decision)
+        player.memory_lst = [dict(m) for m in self.moderator.memory_lst[:-1]]
+        player.memory_lst[-1]["content"] = self.last_moderator_prompt
+        self.players.append(player)
+        self.save_file['escalated'] = True
+        ans = player.ask()
+        player.add_memory(ans)
+        with tracing.span("parse_verdict"):
+            ans = eval(ans)
+        if ans.get("debate_translation", '') != '':
+            self.mod_ans = ans
+
+    def degrade(self):
+        """Out of time: keep the latest moderator verdict if it names a translation, else the base translation"""
+        tracing.instant("deadline_exceeded", budget=self.deadline.budget)
+        self.save_file['slo_missed'] = True
+        if self.mod_ans.get("debate_translation", '') != '':
+            self.save_file.update(self.mod_ans)
+            self.save_file['degraded_to'] = 'moderator'
+        else:
+            self.save_file['debate_translation'] = self.save_file['base_translation']
+            self.save_file['degraded_to'] = 'base_translation'
+        print(f"===== Deadline exceeded, falling back to the {self.save_file['degraded_to']} =====\n")
 
-            judge_player.set_meta_prompt(self.save_file['moderator_meta_prompt'])
+    def debate_round(self, num: int):
+        self.affirmative.add_event(self.save_file['debate_prompt'].replace('##oppo_ans##', self.neg_ans))
+        self.aff_ans = self.affirmative.ask()
+        self.affirmative.add_memory(self.aff_ans)
 
-            # extract answer candidates
-            judge_player.add_event(
-                self.save_file['judge_prompt_last1'].replace('##aff_ans##', aff_ans).replace('##neg_ans##', neg_ans))
-            ans = judge_player.ask()
-            judge_player.add_memory(ans)
+        self.negative.add_event(self.save_file['debate_prompt'].replace('##oppo_ans##', self.aff_ans))
+        self.neg_ans = self.negative.ask()
+        self.negative.add_memory(self.neg_ans)
+
+        self.moderate(num)
+
+    def moderate(self, num: int):
+        """The moderator's verdict on round ``num``
 
-            # select one from the candidates
-            judge_player.add_event(self.save_file['judge_prompt_last2'])
-            ans = judge_player.ask()
-            judge_player.add_memory(ans)
+        In two-step mode ("moderator_decision" in the config) the moderator first only answers whether
+        there is a clear preference (a few tokens, decided on the logprob of "Yes" where available);
+        the full JSON verdict is only asked for when the answer is Yes, i.e. when the debate ends.
+        """
+        def fill(key):
+            return self.save_file[key].replace('##aff_ans##', self.aff_ans).replace(
+                '##neg_ans##', self.neg_ans).replace('##round##', self.round_dct(num))
+
+        self.last_moderator_prompt = fill('moderator_prompt')
+        if self.decision.active(self.moderator.model_name):
+            self.moderator.add_event(fill('moderator_decision_prompt'))
+            ans = self.moderator.ask(max_tokens=self.decision.max_tokens,
+                                     logprobs=self.decision.use_logprobs(self.moderator.model_name))
+            self.moderator.add_memory(ans)
+            decided, p_yes = self.decision.parse(ans, self.moderator.last_logprobs)
+            self.save_file['moderator_decisions'].append({"round": num, "answer": ans, "p_yes": p_yes})
+            if decided is False:
+                self.mod_ans = {"Whether there is a preference": "No", "Supported Side": "", "Reason": "",
+                                "debate_translation": ""}
+                return
+            # Yes (or an unclear answer): the full verdict decides
+            self.moderator.add_event(self.save_file['moderator_verdict_prompt'])
+        else:
+            self.moderator.add_event(self.last_moderator_prompt)
+        self.mod_ans = self.moderator.ask()
+        self.moderator.add_memory(self.mod_ans)
+        with tracing.span("parse_verdict"):
+            self.mod_ans = eval(self.mod_ans)
 
+    def judge(self):
+        judge_player = self.new_player('Judge')
+        aff_ans = self.affirmative.memory_lst[2]['content']
+        neg_ans = self.negative.memory_lst[2]['content']
+
+        judge_player.set_meta_prompt(self.save_file['moderator_meta_prompt'])
+
+        # extract answer candidates
+        judge_player.add_event(
+            self.save_file['judge_prompt_last1'].replace('##aff_ans##', aff_ans).replace('##neg_ans##', neg_ans))
+        ans = judge_player.ask()
+        judge_player.add_memory(ans)
+
+        # select one from the candidates
+        judge_player.add_event(self.save_file['judge_prompt_last2'])
+        ans = judge_player.ask()
+        judge_player.add_memory(ans)
+
+        with tracing.span("parse_verdict"):
             ans = eval(ans)
-            if ans["debate_translation"] != '':
-                self.save_file['success'] = True
-                # save file
-            self.save_file.update(ans)
-            self.players.append(judge_player)
+        if ans["debate_translation"] != '':
+            self.save_file['success'] = True
+            # save file
+        self.save_file.update(ans)
+        self.players.append(judge_player)
 
-        for player in self.players:
-            self.save_file['players'][player.name] = player.memory_lst
+
+@functools.lru_cache(maxsize=None)
+def lang_names(lang_pair: str) -> "tuple[str, str]":
+    """Resolve a language pair like "zh-en" into display names ("Chinese", "English")"""
+    from langcodes import Language
+
+    src_lng, tgt_lng = lang_pair.split('-')
+    src_full = Language.make(language=src_lng).display_name()
+    tgt_full = Language.make(language=tgt_lng).display_name()
+    return src_full, tgt_full
+
+
+def translate_item(id, input: str, config: dict, save_file_dir: str, src_full: str, tgt_full: str,
+                   openai_api_key: str, **debate_kwargs) -> Debate:
+    """Run the debate for one "source\treference" input line and save it to {save_file_dir}/{id}.json
+
+    Args:
+        id: item id, used for the output file names
+        input (str): tab separated source and reference
+        config (dict): prompt config (config4tran.json), updated in place with the item fields
+        save_file_dir (str): output dir
+        src_full (str): source language name
+        tgt_full (str): target language name
+        openai_api_key (str): As the parameter name suggests
+        **debate_kwargs: extra Debate arguments
+    """
+    # files = os.listdir(save_file_dir)
+    # if f"{id}.json" in files:
+    #     continue
+
+    prompts_path = f"{save_file_dir}/{id}-config.json"
+
+    config['source'] = input.split('\t')[0]
+    config['reference'] = input.split('\t')[1]
+    # parts = input.split('\t')
+
+    # config['source'] = parts[0]
+    # 如果没有 reference（你的情况），就留空
+    # config['reference'] = parts[1] if len(parts) > 1 else ""
+
+    config['src_lng'] = src_full
+    config['tgt_lng'] = tgt_full
+
+    with open(prompts_path, 'w') as file:
+        json.dump(config, file, ensure_ascii=False, indent=4)
+
+    with tracing.span("debate"):
+        debate = Debate(save_file_dir=save_file_dir, num_players=3, openai_api_key=openai_api_key,
+                        prompts_path=prompts_path, **debate_kwargs)
+        debate.run()
+    debate.save_file_to_json(id)
+    return debate
 
 
 def parse_args():
@@ -283,24 +526,56 @@ def parse_args():
     parser.add_argument("-k", "--api-key", type=str, required=True, help="OpenAI api key")
     parser.add_argument("-m", "--model-name", type=str, default="deepseek-chat", help="Model name")
     parser.add_argument("-t", "--temperature", type=float, default=0, help="Sampling temperature")
+    parser.add_argument("--trace-file", type=str, default=os.environ.get(tracing.TRACE_FILE_ENV),
+                        help="Write Chrome trace-event spans to this file (open in chrome://tracing or Perfetto)")
+    parser.add_argument("--trace-sample-rate", type=float,
+                        default=float(os.environ.get(tracing.TRACE_SAMPLE_RATE_ENV, 1.0)),
+                        help="Fraction of input items whose spans are recorded")
+    parser.add_argument("--deadline", type=float, default=None,
+                        help="Latency budget per item in seconds; late items fall back to the moderator verdict "
+                             "or base translation and are flagged with slo_missed")
+    parser.add_argument("--call-timeout", type=float, default=None, help="Timeout per API call in seconds")
+    parser.add_argument("--learn-max-tokens", action="store_true",
+                        help="Learn per-role max_tokens from observed completion lengths (overrides the config)")
+    parser.add_argument("--max-tokens-state", type=str, default=None,
+                        help="Json file to load/save the observed completion lengths across runs")
+    parser.add_argument("--base-candidates", type=int, default=None,
+                        help="Base translations sampled in one request; 2 seeds the negative side with its own "
+                             "candidate and runs round 1 of both sides in parallel (overrides the config)")
+    parser.add_argument("--two-step-moderator", action="store_true",
+                        help="Moderator answers only Yes/No after each round and writes the full verdict when the "
+                             "debate ends (overrides moderator_decision.enabled in the config)")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Re-send API calls that are slower than the p95 latency of their role and take the "
+                             "first answer (overrides the config; extra requests capped by hedging.max_extra)")
 
     return parser.parse_args()
 
 
 if __name__ == "__main__":
+    # imported here so that importing Debate from other entry points stays cheap
+    from tqdm import tqdm
+
     args = parse_args()
     openai_api_key = args.api_key
+    tracing.configure(args.trace_file, args.trace_sample_rate)
     # print("DEBUG args.api_key =", repr(openai_api_key))
 
     current_script_path = os.path.abspath(__file__)
     # MAD_path = current_script_path.rsplit("/", 2)[0]
     MAD_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-    src_lng, tgt_lng = args.lang_pair.split('-')
-    src_full = Language.make(language=src_lng).display_name()
-    tgt_full = Language.make(language=tgt_lng).display_name()
+    src_full, tgt_full = lang_names(args.lang_pair)
 
     config = json.load(open(f"{MAD_path}/code/utils/config4tran.json", "r"))
+    token_budget = TokenBudget.from_config(config, state_path=args.max_tokens_state)
+    if args.learn_max_tokens:
+        token_budget.learn = True
+    hedger = Hedger.from_config(config)
+    if args.hedge:
+        hedger.enabled = True
+    if args.two_step_moderator:
+        config.setdefault('moderator_decision', {})['enabled'] = True
 
     # inputs = open(args.input_file, "r").readlines()
     inputs = open(args.input_file, "r", encoding="utf-8").readlines()
@@ -311,28 +586,23 @@ if __name__ == "__main__":
     if not os.path.exists(save_file_dir):
         os.mkdir(save_file_dir)
 
-    for id, input in enumerate(tqdm(inputs)):
-        # files = os.listdir(save_file_dir)
-        # if f"{id}.json" in files:
-        #     continue
-
-        prompts_path = f"{save_file_dir}/{id}-config.json"
-
-        config['source'] = input.split('\t')[0]
-        config['reference'] = input.split('\t')[1]
-        # parts = input.split('\t')
-
-        # config['source'] = parts[0]
-        # 如果没有 reference（你的情况），就留空
-        # config['reference'] = parts[1] if len(parts) > 1 else ""
-
-        config['src_lng'] = src_full
-        config['tgt_lng'] = tgt_full
-
-        with open(prompts_path, 'w') as file:
-            json.dump(config, file, ensure_ascii=False, indent=4)
-
-        debate = Debate(save_file_dir=save_file_dir, num_players=3, openai_api_key=openai_api_key,
-                        prompts_path=prompts_path, temperature=0, sleep_time=0)
-        debate.run()
-        debate.save_file_to_json(id)
+    slo_missed = []
+    role_stats = {}
+    with tracing.span("run", input_file=args.input_file, items=len(inputs)):
+        for id, input in enumerate(tqdm(inputs)):
+            with tracing.span("item", sample=True, id=id):
+                debate = translate_item(id, input, config, save_file_dir, src_full, tgt_full, openai_api_key,
+                                        temperature=0, sleep_time=0, deadline=args.deadline,
+                                        call_timeout=args.call_timeout, token_budget=token_budget,
+                                        hedger=hedger, base_candidates=args.base_candidates)
+            if debate.save_file['slo_missed']:
+                slo_missed.append(id)
+            merge_role_stats(role_stats, debate.save_file['role_stats'])
+    tracing.flush()
+    token_budget.save()
+    print(f"max_tokens budgets: {token_budget.summary()}")
+    print(format_role_stats(role_stats))
+    if hedger.enabled:
+        print(f"hedging: {hedger.summary()}")
+    if args.deadline is not None:
+        print(f"{len(slo_missed)}/{len(inputs)} items missed the {args.deadline}s deadline: {slo_missed}")
@@ -0,0 +1,162 @@
+"""
+Distributed translation debates over a shared SQLite work queue.
+
+    # once: put the input lines into the queue
+    python code/debate_queue.py enqueue -q /shared/mad.db -i data/CommonMT/input.example.txt -o /shared/out -lp zh-en
+    # on every host, as many processes as the rate limit allows
+    python code/debate_queue.py work -q /shared/mad.db -k sk-...
+    # progress, in-flight items and failures
+    python code/debate_queue.py status -q /shared/mad.db
+"""
+
+import os
+import json
+import argparse
+import time
+import traceback
+from datetime import datetime
+from debate4tran import lang_names, translate_item
+from utils import tracing
+from utils.token_budget import TokenBudget
+from utils.hedging import Hedger
+from utils.work_queue import WorkQueue, Heartbeat, default_worker_id
+
+
+def enqueue(args):
+    inputs = open(args.input_file, "r", encoding="utf-8").readlines()
+    inputs = [l.strip() for l in inputs]
+    # validate now rather than when a worker picks the line up
+    for id, input in enumerate(inputs):
+        if len(input.split('\t')) < 2:
+            raise ValueError(f"{args.input_file}:{id + 1}: expected 'source<TAB>reference'")
+
+    queue = WorkQueue(args.queue)
+    output_dir = os.path.abspath(args.output_dir)
+    added = queue.enqueue(list(enumerate(inputs)), output_dir, args.lang_pair)
+    print(f"Queued {added} new items ({len(inputs) - added} already present) for {output_dir}")
+
+
+def work(args):
+    MAD_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    config_template = json.load(open(f"{MAD_path}/code/utils/config4tran.json", "r"))
+    token_budget = TokenBudget.from_config(config_template)
+    hedger = Hedger.from_config(config_template)
+    if args.hedge:
+        hedger.enabled = True
+    queue = WorkQueue(args.queue, lease_time=args.lease_time, max_attempts=args.max_attempts)
+    worker = args.worker_id or default_worker_id()
+    lang_cache = {}
+
+    done = 0
+    with tracing.span("run", worker=worker):
+        while args.max_items is None or done < args.max_items:
+            item = queue.claim(worker)
+            if item is None:
+                if not args.wait:
+                    break
+                time.sleep(args.poll_interval)
+                continue
+
+            if item["lang_pair"] not in lang_cache:
+                lang_cache[item["lang_pair"]] = lang_names(item["lang_pair"])
+            src_full, tgt_full = lang_cache[item["lang_pair"]]
+            os.makedirs(item["output_dir"], exist_ok=True)
+
+            start = time.time()
+            with tracing.span("item", sample=True, id=item["item_key"]), \
+                    Heartbeat(queue, item["id"], worker, args.heartbeat_interval) as heartbeat:
+                try:
+                    debate = translate_item(item["item_key"], item["payload"], dict(config_template),
+                                            item["output_dir"], src_full, tgt_full, args.api_key,
+                                            model_name=args.model_name, temperature=args.temperature, sleep_time=0,
+                                            deadline=args.deadline, call_timeout=args.call_timeout,
+                                            token_budget=token_budget, hedger=hedger)
+                except Exception as e:
+                    traceback.print_exc()
+                    queue.fail(item["id"], worker, f"{type(e).__name__}: {e}")
+                    continue
+
+            if heartbeat.lost or not queue.complete(item["id"], worker):
+                print(f"Warning: lease on item {item['item_key']} expired while it was running; "
+                      f"another worker may redo it.")
+            done += 1
+            slo = " (missed deadline)" if debate.save_file['slo_missed'] else ""
+            print(f"[{worker}] item {item['item_key']} done in {time.time() - start:.1f}s{slo} ({done} this worker)")
+    tracing.flush()
+    if hedger.enabled:
+        print(f"[{worker}] hedging: {hedger.summary()}")
+
+
+def status(args):
+    queue = WorkQueue(args.queue)
+    if args.retry_failed:
+        print(f"Re-queued {queue.retry_failed()} failed items")
+    st = queue.status(window=args.window)
+    counts = st["counts"]
+    total = sum(counts.values())
+    print(f"===== Queue {args.queue} =====")
+    print(f"total={total} queued={counts['queued']} in-flight={counts['leased']} "
+          f"done={counts['done']} failed={counts['failed']}")
+    print(f"throughput: {st['throughput_recent']:.2f} items/min (last {st['window'] / 60:.0f} min), "
+          f"{st['throughput_overall']:.2f} items/min overall, mean latency {st['mean_latency']:.1f}s")
+
+    now = time.time()
+    if st["in_flight"]:
+        print("\n----- In flight -----")
+        for item in st["in_flight"]:
+            started = datetime.fromtimestamp(item["started_at"]).strftime("%Y-%m-%d_%H:%M:%S")
+            print(f"{item['output_dir']}/{item['item_key']}  worker={item['worker']}  attempt={item['attempts']}  "
+                  f"started={started}  lease left={item['lease_expires'] - now:.0f}s")
+    if st["failures"]:
+        print("\n----- Failures -----")
+        for item in st["failures"]:
+            print(f"{item['output_dir']}/{item['item_key']}  attempts={item['attempts']}  {item['error']}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser("", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("enqueue", help="Add input lines to the queue")
+    p.add_argument("-q", "--queue", type=str, required=True, help="Queue database (sqlite file on shared storage)")
+    p.add_argument("-i", "--input-file", type=str, required=True, help="Input file path")
+    p.add_argument("-o", "--output-dir", type=str, required=True, help="Output file dir")
+    p.add_argument("-lp", "--lang-pair", type=str, required=True, help="Language pair")
+    p.set_defaults(func=enqueue)
+
+    p = sub.add_parser("work", help="Claim items and run debates until the queue is empty")
+    p.add_argument("-q", "--queue", type=str, required=True, help="Queue database (sqlite file on shared storage)")
+    p.add_argument("-k", "--api-key", type=str, required=True, help="OpenAI api key")
+    p.add_argument("-m", "--model-name", type=str, default="deepseek-chat", help="Model name")
+    p.add_argument("-t", "--temperature", type=float, default=0, help="Sampling temperature")
+    p.add_argument("--worker-id", type=str, default=None, help="Worker name (default: host:pid)")
+    p.add_argument("--lease-time", type=float, default=600, help="Seconds a claim stays valid without heartbeat")
+    p.add_argument("--heartbeat-interval", type=float, default=60, help="Seconds between lease renewals")
+    p.add_argument("--max-attempts", type=int, default=3, help="Claims per item before it is marked failed")
+    p.add_argument("--max-items", type=int, default=None, help="Stop after this many items")
+    p.add_argument("--wait", action="store_true", help="Keep polling when the queue is empty")
+    p.add_argument("--poll-interval", type=float, default=10, help="Seconds between polls with --wait")
+    p.add_argument("--deadline", type=float, default=None, help="Latency budget per item in seconds")
+    p.add_argument("--call-timeout", type=float, default=None, help="Timeout per API call in seconds")
+    p.add_argument("--hedge", action="store_true", help="Hedge API calls slower than the p95 of their role")
+    p.add_argument("--trace-file", type=str, default=os.environ.get(tracing.TRACE_FILE_ENV),
+                   help="Write Chrome trace-event spans to this file")
+    p.add_argument("--trace-sample-rate", type=float,
+                   default=float(os.environ.get(tracing.TRACE_SAMPLE_RATE_ENV, 1.0)),
+                   help="Fraction of items whose spans are recorded")
+    p.set_defaults(func=work)
+
+    p = sub.add_parser("status", help="Show throughput, in-flight items and failures")
+    p.add_argument("-q", "--queue", type=str, required=True, help="Queue database (sqlite file on shared storage)")
+    p.add_argument("--window", type=float, default=600, help="Seconds used for the recent throughput")
+    p.add_argument("--retry-failed", action="store_true", help="Re-queue failed items before reporting")
+    p.set_defaults(func=status)
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "work":
+        tracing.configure(args.trace_file, args.trace_sample_rate)
+    args.func(args)
@@ -0,0 +1,315 @@
+"""
+Run many translation debate jobs (datasets x language pairs x models x prompt configs) from
+one manifest in a single process.
+
+All jobs share one worker pool, the OpenAI client pool, an optional requests/minute limit,
+the language name cache and, per prompt config and model, the loaded config, max_tokens
+budgets and hedging state (jobs on another model do not mix their completion lengths into
+the same budgets).  Items are handed to the workers round-robin across jobs, so a large dataset
+does not hold back the small ones queued after it.  Items whose {id}.json already exists are
+skipped, so an interrupted run can simply be started again.
+
+    python code/run_manifest.py -m jobs.yaml -k sk-...
+
+Manifest (YAML needs pyyaml, JSON works without; relative paths are resolved against the
+manifest's directory):
+
+    workers: 8                      # debates in flight, across all jobs
+    requests_per_minute: 300        # shared API rate limit, optional
+    defaults:                       # applied to every job
+      model_name: deepseek-chat
+      config: code/utils/config4tran.json
+    jobs:
+      - name: commonmt-zh-en
+        input: data/CommonMT/input.example.txt
+        lang_pair: zh-en
+        output_dir: out/commonmt-zh-en
+      - name: commonmt-zh-en-reasoner
+        input: data/CommonMT/input.example.txt
+        lang_pair: zh-en
+        output_dir: out/commonmt-zh-en-reasoner
+        model_name: deepseek-reasoner
+
+Job keys: name, input, lang_pair, output_dir, model_name, config, temperature, max_round,
+deadline, call_timeout, limit, base_candidates.
+"""
+
+import os
+import json
+import argparse
+import itertools
+import math
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from debate4tran import lang_names, translate_item
+from utils import tracing
+from utils import rate_limit
+from utils.token_budget import TokenBudget
+from utils.hedging import Hedger
+from utils.model_router import merge_role_stats, format_role_stats
+
+MAD_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+JOB_DEFAULTS = {
+    "model_name": "deepseek-chat",
+    "config": os.path.join(MAD_path, "code", "utils", "config4tran.json"),
+    "temperature": 0,
+    "max_round": 3,
+    "deadline": None,
+    "call_timeout": None,
+    "limit": None,
+    "base_candidates": None,
+}
+JOB_REQUIRED = ("input", "lang_pair", "output_dir")
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[max(0, math.ceil(q * len(values)) - 1)] if values else 0.0
+
+
+def load_manifest(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml  # pip: pyyaml
+
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+class SharedConfig:
+    def __init__(self, path: str, hedge: bool = False, concurrency: int = 1) -> None:
+        """A prompt config and the state learned from it, shared by every job that uses it with the same model"""
+        with open(path, "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+        self.token_budget = TokenBudget.from_config(self.config)
+        self.hedger = Hedger.from_config(self.config, concurrency)
+        if hedge:
+            self.hedger.enabled = True
+
+
+class Job:
+    def __init__(self, spec: dict, base_dir: str, shared: SharedConfig) -> None:
+        def resolve(path):
+            return path if os.path.isabs(path) else os.path.normpath(os.path.join(base_dir, path))
+
+        self.input = resolve(spec["input"])
+        self.lang_pair = spec["lang_pair"]
+        self.output_dir = resolve(spec["output_dir"])
+        self.model_name = spec["model_name"]
+        self.name = spec.get("name") or f"{os.path.basename(self.input)}:{self.lang_pair}:{self.model_name}"
+        self.shared = shared
+        self.debate_kwargs = {"model_name": self.model_name, "temperature": spec["temperature"],
+                              "max_round": spec["max_round"], "sleep_time": 0, "deadline": spec["deadline"],
+                              "call_timeout": spec["call_timeout"], "token_budget": shared.token_budget,
+                              "hedger": shared.hedger, "base_candidates": spec["base_candidates"]}
+
+        with open(self.input, "r", encoding="utf-8") as f:
+            inputs = [l.strip() for l in f.readlines()][:spec["limit"]]
+        # validate now rather than hours into the run
+        for id, input in enumerate(inputs):
+            if len(input.split('\t')) < 2:
+                raise ValueError(f"{self.input}:{id + 1}: expected 'source<TAB>reference'")
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.items = len(inputs)
+        self.pending = deque((id, input) for id, input in enumerate(inputs) if not self.is_done(id))
+        self.skipped = self.items - len(self.pending)
+
+        self.done = 0
+        self.failed = []
+        self.latencies = []
+        self.slo_missed = 0
+        self.tokens = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        self.role_stats = {}
+        self.started = None
+        self.finished = None
+
+    def is_done(self, id) -> bool:
+        path = os.path.join(self.output_dir, f"{id}.json")
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return bool(json.load(f).get("end_time"))
+        except json.JSONDecodeError:
+            return False
+
+    def record(self, debate):
+        save_file = debate.save_file
+        self.done += 1
+        self.latencies.append(save_file["latency"])
+        self.slo_missed += bool(save_file["slo_missed"])
+        for usage in save_file["usage"].values():
+            for k in self.tokens:
+                self.tokens[k] += usage.get(k, 0)
+        merge_role_stats(self.role_stats, save_file["role_stats"])
+
+    def summary(self) -> dict:
+        wall = (self.finished - self.started) if self.started and self.finished else 0.0
+        return {
+            "name": self.name, "lang_pair": self.lang_pair, "model_name": self.model_name,
+            "output_dir": self.output_dir, "items": self.items, "skipped": self.skipped,
+            "done": self.done, "failed": sorted(self.failed), "wall_seconds": round(wall, 3),
+            "items_per_min": self.done / wall * 60 if wall else 0.0,
+            "latency": {"mean": sum(self.latencies) / len(self.latencies) if self.latencies else 0.0,
+                        "p50": percentile(self.latencies, 0.5), "p95": percentile(self.latencies, 0.95)},
+            "slo_missed": self.slo_missed, "tokens": self.tokens, "role_stats": self.role_stats,
+        }
+
+
+def build_jobs(manifest: dict, base_dir: str, hedge: bool = False, workers: int = 1) -> "list[Job]":
+    defaults = dict(JOB_DEFAULTS, **(manifest.get("defaults") or {}))
+    shared = {}
+    jobs, output_dirs = [], set()
+    for n, entry in enumerate(manifest.get("jobs") or [], 1):
+        spec = dict(defaults, **entry)
+        missing = [k for k in JOB_REQUIRED if not spec.get(k)]
+        if missing:
+            raise ValueError(f"Job {n} ({spec.get('name', 'unnamed')}) is missing {', '.join(missing)}")
+        config_path = spec["config"]
+        if not os.path.isabs(config_path):
+            config_path = os.path.normpath(os.path.join(base_dir, config_path))
+        key = (config_path, spec["model_name"])
+        if key not in shared:
+            shared[key] = SharedConfig(config_path, hedge, workers)
+        job = Job(spec, base_dir, shared[key])
+        # two jobs writing {id}.json into the same dir would overwrite each other
+        if job.output_dir in output_dirs:
+            raise ValueError(f"Job {job.name}: output_dir {job.output_dir} is used by another job")
+        output_dirs.add(job.output_dir)
+        jobs.append(job)
+    if not jobs:
+        raise ValueError("The manifest has no jobs")
+    return jobs
+
+
+def schedule(jobs: "list[Job]"):
+    """Items of all jobs, round-robin: one item of every job with work left in turn"""
+    active = deque(job for job in jobs if job.pending)
+    while active:
+        job = active.popleft()
+        yield job, job.pending.popleft()
+        if job.pending:
+            active.append(job)
+
+
+def run_item(job: Job, id, input: str, openai_api_key: str):
+    src_full, tgt_full = lang_names(job.lang_pair)
+    with tracing.span("item", sample=True, job=job.name, id=id):
+        return translate_item(id, input, dict(job.shared.config), job.output_dir, src_full, tgt_full,
+                              openai_api_key, **job.debate_kwargs)
+
+
+def run(jobs: "list[Job]", openai_api_key: str, workers: int) -> dict:
+    items = schedule(jobs)
+    total = sum(len(job.pending) for job in jobs)
+    start = time.time()
+    finished = 0
+    with tracing.span("run", jobs=len(jobs), items=total), ThreadPoolExecutor(max_workers=workers) as pool:
+        running = {}
+
+        def fill():
+            # keep only `workers` items in flight so the round-robin order decides what runs next
+            for job, (id, input) in itertools.islice(items, workers - len(running)):
+                if job.started is None:
+                    job.started = time.time()
+                running[pool.submit(run_item, job, id, input, openai_api_key)] = (job, id)
+
+        fill()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, id = running.pop(future)
+                try:
+                    job.record(future.result())
+                except Exception:
+                    traceback.print_exc()
+                    job.failed.append(id)
+                job.finished = time.time()
+                finished += 1
+                print(f"[{finished}/{total}] {job.name} item {id} {'failed' if id in job.failed else 'done'}")
+            fill()
+    wall = time.time() - start
+
+    role_stats = {}
+    for job in jobs:
+        merge_role_stats(role_stats, job.role_stats)
+    done = sum(job.done for job in jobs)
+    return {
+        "jobs": [job.summary() for job in jobs],
+        "total": {"items": sum(job.items for job in jobs), "skipped": sum(job.skipped for job in jobs),
+                  "done": done, "failed": sum(len(job.failed) for job in jobs), "wall_seconds": round(wall, 3),
+                  "items_per_min": done / wall * 60 if wall else 0.0, "workers": workers},
+        "role_stats": role_stats,
+    }
+
+
+def print_summary(summary: dict):
+    print("\n===== Jobs =====")
+    print(f"{'job':<32}{'done':>6}{'skip':>6}{'fail':>6}{'wall s':>9}{'items/min':>11}{'lat p50':>9}{'lat p95':>9}"
+          f"{'tokens':>10}")
+    for job in summary["jobs"]:
+        tokens = job["tokens"]["prompt_tokens"] + job["tokens"]["completion_tokens"]
+        print(f"{job['name'][:31]:<32}{job['done']:>6}{job['skipped']:>6}{len(job['failed']):>6}"
+              f"{job['wall_seconds']:>9.1f}{job['items_per_min']:>11.2f}{job['latency']['p50']:>9.1f}"
+              f"{job['latency']['p95']:>9.1f}{tokens:>10}")
+    t = summary["total"]
+    print(f"total: {t['done']} debates ({t['skipped']} already done, {t['failed']} failed) in {t['wall_seconds']:.1f}s "
+          f"= {t['items_per_min']:.2f} items/min with {t['workers']} workers")
+    if summary["role_stats"]:
+        print()
+        print(format_role_stats(summary["role_stats"]))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser("", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument("-m", "--manifest", type=str, required=True, help="Job manifest (.yaml/.yml or .json)")
+    parser.add_argument("-k", "--api-key", type=str, required=True, help="OpenAI api key")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Debates in flight across all jobs (overrides the manifest, default 4)")
+    parser.add_argument("--requests-per-minute", type=float, default=None,
+                        help="Shared API rate limit (overrides the manifest)")
+    parser.add_argument("--hedge", action="store_true", help="Hedge API calls slower than the p95 of their role")
+    parser.add_argument("-s", "--summary", type=str, default=None,
+                        help="Write the per-job / global summary json here (default: next to the manifest)")
+    parser.add_argument("--trace-file", type=str, default=os.environ.get(tracing.TRACE_FILE_ENV),
+                        help="Write Chrome trace-event spans to this file")
+    parser.add_argument("--trace-sample-rate", type=float,
+                        default=float(os.environ.get(tracing.TRACE_SAMPLE_RATE_ENV, 1.0)),
+                        help="Fraction of items whose spans are recorded")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    tracing.configure(args.trace_file, args.trace_sample_rate)
+
+    manifest = load_manifest(args.manifest)
+    workers = args.workers or manifest.get("workers") or 4
+    jobs = build_jobs(manifest, os.path.dirname(os.path.abspath(args.manifest)), hedge=args.hedge, workers=workers)
+    limiter = rate_limit.configure(args.requests_per_minute or manifest.get("requests_per_minute"),
+                                   manifest.get("burst"))
+    for job in jobs:
+        print(f"{job.name}: {len(job.pending)} items to run ({job.skipped} already done) -> {job.output_dir}")
+
+    summary = run(jobs, args.api_key, workers)
+    tracing.flush()
+    for job in jobs:
+        job.shared.token_budget.save()
+    if limiter is not None:
+        summary["rate_limit"] = limiter.summary()
+    hedgers = {id(job.shared): job.shared.hedger for job in jobs if job.shared.hedger.enabled}
+    if hedgers:
+        summary["hedging"] = [h.summary() for h in hedgers.values()]
+
+    print_summary(summary)
+    if "rate_limit" in summary:
+        print(f"rate limit: {summary['rate_limit']}")
+    summary_path = args.summary or os.path.splitext(os.path.abspath(args.manifest))[0] + ".summary.json"
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=4)
+    print(f"Summary: {summary_path}")
@@ -1,35 +1,16 @@
-import openai
-import backoff
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import time
 import random
-# from openai.error import RateLimitError, APIError, ServiceUnavailableError, APIConnectionError
-from openai import (
-    RateLimitError,
-    APIError,
-    APIConnectionError,
-)
-from openai import OpenAI, RateLimitError, APIError, APIConnectionError, InternalServerError
-
-try:
-    from openai.error import (
-        RateLimitError,
-        APIError,
-        ServiceUnavailableError,
-        APIConnectionError,
-
-    )
-except ImportError:
-    from openai import (
-        RateLimitError,
-        APIError,
-        APIConnectionError,
-        InternalServerError,
-    )
-
-    ServiceUnavailableError = APIError
 
 from .openai_utils import OutOfQuotaException, AccessTerminatedException
 from .openai_utils import num_tokens_from_string, model2max_context
+from .deadline import Deadline, DeadlineExceededException
+from .token_budget import TokenBudget
+from .hedging import Hedger
+from . import tracing
+from . import rate_limit
 import re
 
 def sanitize_api_key(k: str) -> str:
@@ -49,6 +30,62 @@ def sanitize_api_key(k: str) -> str:
 
     return k
 
+
+def _retry_exceptions() -> tuple:
+    # openai is imported here rather than at module level: it is by far the slowest import of a
+    # debate run and is not needed until the first API call.
+    try:
+        from openai.error import RateLimitError, APIError, ServiceUnavailableError, APIConnectionError
+        return RateLimitError, APIError, ServiceUnavailableError, APIConnectionError
+    except ImportError:
+        from openai import RateLimitError, APIError, APIConnectionError, InternalServerError
+        return RateLimitError, APIError, APIConnectionError, InternalServerError
+
+
+def _on_backoff(details):
+    tracing.instant("backoff", wait=details["wait"], tries=details["tries"])
+    # do not sleep past the debate deadline: give up now so the debate can degrade
+    deadline = details["args"][0].deadline
+    if deadline is not None and deadline.remaining() is not None and details["wait"] >= deadline.remaining():
+        raise DeadlineExceededException(deadline.budget, f"retry {details['tries']} of {details['target'].__name__}")
+
+
+def _with_backoff(func):
+    """Retry ``func`` with exponential backoff; the ``backoff`` policy is built on first call"""
+    retrying = None
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        nonlocal retrying
+        if retrying is None:
+            import backoff
+            retrying = backoff.on_exception(
+                backoff.expo,
+                _retry_exceptions(),
+                max_tries=20,
+                on_backoff=_on_backoff
+            )(func)
+        return retrying(*args, **kwargs)
+
+    return wrapper
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_key: str, base_url: str = "https://api.deepseek.com"):
+    """Return a shared OpenAI client per (key, base_url) so connections stay warm across calls"""
+    with _clients_lock:
+        client = _clients.get((api_key, base_url))
+        if client is None:
+            from openai import OpenAI
+            client = _clients[(api_key, base_url)] = OpenAI(api_key=api_key, base_url=base_url)
+        return client
+
+# models seen ignoring or rejecting the n parameter; their extra choices are sampled in parallel right away
+_no_n_models = set()
+_no_n_models_lock = threading.Lock()
+
 # support_models = ['gpt-3.5-turbo', 'gpt-3.5-turbo-0301', 'gpt-4', 'gpt-4-0314']
 support_models = [
     'gpt-3.5-turbo', 'gpt-3.5-turbo-0301', 'gpt-4', 'gpt-4-0314',
@@ -58,7 +95,9 @@ support_models = [
 
 class Agent:
     def __init__(self, model_name: str, name: str, temperature: float, sleep_time: float = 0,
-                 api_key: str = None) -> None:
+                 api_key: str = None, timeout: float = None, deadline: Deadline = None, role: str = None,
+                 token_budget: TokenBudget = None, hedger: Hedger = None, on_message=None,
+                 budget_key: str = None) -> None:
         """Create an agent
 
         Args:
@@ -66,6 +105,14 @@ class Agent:
             name (str): name of this agent
             temperature (float): higher values make the output more random, while lower values make it more focused and deterministic
             sleep_time (float): sleep because of rate limits
+            timeout (float): per-call timeout in seconds, None for the client default
+            deadline (Deadline): latency budget shared with the other players of the debate
+            role (str): role key for per-role settings ("baseline", "affirmative", "negative", "moderator", "judge")
+            token_budget (TokenBudget): per-role max_tokens budgets, None to use the whole context window
+            hedger (Hedger): sends a duplicate request when a call is slower than usual for its role
+            on_message: callback(name, content) invoked for every answer added to the memory (e.g. streaming)
+            budget_key (str): key of this agent in token_budget, default the role
+                (e.g. "moderator@deepseek-reasoner" for a moderator on another model)
         """
         self.model_name = model_name
         self.name = name
@@ -73,15 +120,23 @@ class Agent:
         self.memory_lst = []
         self.sleep_time = sleep_time
         self.openai_api_key = api_key
+        self.timeout = timeout
+        self.deadline = deadline
+        self.role = role
+        self.token_budget = token_budget
+        self.budget_key = budget_key or role
+        self.hedger = hedger
+        self.on_message = on_message
+        self.usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "truncated": 0, "seconds": 0.0}
+        self.last_finish_reason = None
+        self.last_completion_tokens = None
+        self.last_logprobs = None
 
         # @backoff.on_exception(backoff.expo, (RateLimitError, APIError, ServiceUnavailableError, APIConnectionError), max_tries=20)
 
-    @backoff.on_exception(
-        backoff.expo,
-        (RateLimitError, APIError, APIConnectionError, InternalServerError),
-        max_tries=20
-    )
-    def query(self, messages: "list[dict]", max_tokens: int, api_key: str, temperature: float) -> str:
+    @_with_backoff
+    def query(self, messages: "list[dict]", max_tokens: int, api_key: str, temperature: float,
+              n: int = 1, logprobs: bool = False) -> "str | list[str]":
         """make a query
 
         Args:
@@ -89,38 +144,77 @@ class Agent:
             max_tokens (int): max token in api call
             api_key (str): openai api key
             temperature (float): sampling temperature
+            n (int): number of choices to sample; one request with ``n`` where the API supports it,
+                otherwise the missing choices are requested in parallel
+            logprobs (bool): request the top-5 logprobs per token (kept in last_logprobs)
 
         Raises:
             OutOfQuotaException: the apikey has out of quota
             AccessTerminatedException: the apikey has been ban
+            DeadlineExceededException: the debate deadline passed before the call could finish
 
         Returns:
-            str: the return msg
+            str | list[str]: the return msg, or the n return msgs if n > 1
         """
-        time.sleep(self.sleep_time)
+        if self.deadline is not None:
+            self.deadline.check(self.name)
+        if self.sleep_time:
+            with tracing.span("sleep", seconds=self.sleep_time):
+                time.sleep(self.sleep_time)
         if self.model_name not in support_models:
             print(f"Warning: {self.model_name} not in support_models. Proceeding anyway.")
         api_key = sanitize_api_key(api_key)
+        from openai import RateLimitError
 
         # 定位用：确认运行时到底拿到什么 key（跑通后可删除这行）
         # print("DEBUG api_key repr:", repr(api_key))
 
-        client = OpenAI(
-            api_key=api_key,
-            base_url="https://api.deepseek.com"
-        )
+        client = get_client(api_key)
+        timeout = self.deadline.timeout(self.timeout) if self.deadline is not None else self.timeout
+        if timeout is not None:
+            # retries are handled by our backoff (which respects the deadline), not by the client
+            client = client.with_options(timeout=timeout, max_retries=0)
 
         try:
             # 新版 API 调用语法
-            response = client.chat.completions.create(
-                model=self.model_name,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-            )
+            start = time.monotonic()
+            try:
+                with tracing.span("api_attempt", model=self.model_name, max_tokens=max_tokens, timeout=timeout):
+                    def create(k: int = 1):
+                        # process-wide requests/minute limit (shared by all debates, hedges included)
+                        rate_limit.acquire()
+                        return client.chat.completions.create(
+                            model=self.model_name,
+                            messages=messages,
+                            temperature=temperature,
+                            max_tokens=max_tokens,
+                            **({"n": k} if k > 1 else {}),
+                            **({"logprobs": True, "top_logprobs": 5} if logprobs else {}),
+                        )
+
+                    if n > 1:
+                        responses = self._sample(create, n)
+                    elif self.hedger is not None:
+                        responses = [self.hedger.call(f"{self.role}/{self.model_name}", create)]
+                    else:
+                        responses = [create()]
+            finally:
+                self.usage["seconds"] += time.monotonic() - start
             # 修改返回值的获取方式 对象属性
-            gen = response.choices[0].message.content
-            return gen
+            choices = [choice for response in responses for choice in response.choices][:n]
+            gens = [choice.message.content for choice in choices]
+            finish_reasons = [getattr(choice, "finish_reason", None) for choice in choices]
+            self.last_finish_reason = "length" if "length" in finish_reasons else finish_reasons[0]
+            self.last_logprobs = getattr(choices[0], "logprobs", None)
+            self.last_completion_tokens = None
+            self.usage["calls"] += len(responses)
+            for response in responses:
+                usage = getattr(response, "usage", None)
+                if usage is not None:
+                    self.last_completion_tokens = (self.last_completion_tokens or 0) + usage.completion_tokens
+                    self.usage["prompt_tokens"] += usage.prompt_tokens
+                    self.usage["completion_tokens"] += usage.completion_tokens
+            return gens if n > 1 else gens[0]
 
         except RateLimitError as e:
             # 新版异常信息处理
@@ -135,6 +229,28 @@ class Agent:
             print(f"Unexpected Error: {e}")
             raise e
 
+    def _sample(self, create, n: int) -> list:
+        """Responses holding n choices: one request with ``n``, and the choices an API without ``n``
+        support (DeepSeek returns a single choice) did not return as parallel single requests"""
+        from openai import BadRequestError
+
+        responses = []
+        with _no_n_models_lock:
+            use_n = self.model_name not in _no_n_models
+        if use_n:
+            try:
+                responses.append(create(n))
+            except BadRequestError as e:
+                print(f"Warning: {self.model_name} rejected n={n} ({e}), sampling with parallel requests.")
+        missing = n - sum(len(response.choices) for response in responses)
+        if missing > 0:
+            with ThreadPoolExecutor(max_workers=missing) as pool:
+                futures = [pool.submit(tracing.bind(create), 1) for _ in range(missing)]
+                responses += [future.result() for future in futures]
+            with _no_n_models_lock:
+                _no_n_models.add(self.model_name)
+        return responses
+
     def set_meta_prompt(self, meta_prompt: str):
         """Set the meta_prompt
 
@@ -162,29 +278,79 @@ class Agent:
         # 将智能体自己的回答存入记忆
         self.memory_lst.append({"role": "assistant", "content": f"{memory}"})
         print(f"----- {self.name} -----\n{memory}\n")
+        if self.on_message is not None:
+            self.on_message(self.name, memory)
+
+    def ask(self, temperature: float = None, n: int = 1, max_tokens: int = None, logprobs: bool = False):
+        """Answer the current memory
 
-    def ask(self, temperature: float = None):
+        Args:
+            temperature (float): sampling temperature, default the agent's
+            n (int): with n > 1, a list of n sampled answers from one request
+            max_tokens (int): hard output limit for this call (e.g. a one-word decision) instead of
+                the role budget; such calls are neither retried on truncation nor learned from
+            logprobs (bool): also request token logprobs (see last_logprobs)
+        """
+        with tracing.span(self.name, cat="role", model=self.model_name, n=n):
+            return self._ask(temperature, n, max_tokens, logprobs)
+
+    def _ask(self, temperature: float = None, n: int = 1, max_tokens: int = None, logprobs: bool = False):
         # 处理 Token
         # 注意：DeepSeek 的 token 计算可能与 GPT 不完全一致，这里沿用 tiktoken 做估算
         model_for_token = self.model_name
         if "deepseek" in self.model_name:
             model_for_token = "gpt-3.5-turbo"  # 用 gpt-3.5 代替计算长度
 
-        num_context_token = sum([num_tokens_from_string(m["content"], model_for_token) for m in self.memory_lst])
+        with tracing.span("tokenize", messages=len(self.memory_lst)):
+            num_context_token = sum([num_tokens_from_string(m["content"], model_for_token) for m in self.memory_lst])
 
         # 获取最大上下文限制，如果 deepseek 不在 model2max_context 里，给个默认值
         max_total_tokens = model2max_context.get(self.model_name, 8192)
-        max_token = max_total_tokens - num_context_token
+        context_room = max_total_tokens - num_context_token
 
         # 确保不会出现负数
-        if max_token <= 0:
+        if context_room <= 0:
             print("Warning: Context window exceeded.")
-            max_token = 512
+            context_room = 512
+
+        # 按角色的输出预算（如主持人只需要输出一个很短的 JSON）
+        max_token = context_room
+        budget = self.token_budget.limit(self.budget_key) if self.token_budget is not None else None
+        if max_tokens is not None:
+            max_token = min(context_room, max_tokens)
+        elif budget is not None:
+            max_token = min(context_room, budget)
 
         # 注意：这里需要确保 DebatePlayer 传过来的 self.openai_api_key 存在
-        return self.query(
+        ans = self.query(
             self.memory_lst,
             max_token,
             api_key=self.openai_api_key,  # 这里会调用子类 DebatePlayer 中的属性
-            temperature=temperature if temperature else self.temperature
+            temperature=temperature if temperature else self.temperature,
+            n=n,
+            logprobs=logprobs
         )
+        if max_tokens is not None:
+            return ans
+
+        if self.last_finish_reason == "length" and max_token < context_room:
+            # cut off by the role budget rather than the context window: retry once without the budget
+            print(f"Warning: {self.name} hit its {max_token}-token budget, retrying once with {context_room}.")
+            tracing.instant("budget_truncated", role=self.budget_key, budget=max_token)
+            self.usage["truncated"] += 1
+            ans = self.query(
+                self.memory_lst,
+                context_room,
+                api_key=self.openai_api_key,
+                temperature=temperature if temperature else self.temperature,
+                n=n
+            )
+
+        if self.token_budget is not None:
+            completion_tokens = self.last_completion_tokens
+            if completion_tokens is None:
+                answers = ans if n > 1 else [ans]
+                completion_tokens = sum(num_tokens_from_string(a or "", model_for_token) for a in answers)
+            # budgets are per answer
+            self.token_budget.observe(self.budget_key, completion_tokens // n)
+        return ans
@@ -0,0 +1,117 @@
+"""
+Persistent COMET score cache.
+
+Scores are keyed by sha256(model, src, mt, ref), so a triple is scored once no matter
+how often it occurs: ``debate_translation == base_translation`` items, repeated runs
+over the same output dir and re-evaluations after a few new items are added all reuse
+earlier scores, and the COMET model is only loaded when something is actually missing.
+
+    export MAD_COMET_CACHE=/shared/comet_scores.sqlite   # default: ~/.cache/mad/comet_scores.sqlite
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+COMET_CACHE_ENV = "MAD_COMET_CACHE"
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "mad", "comet_scores.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    key BLOB PRIMARY KEY,
+    model TEXT NOT NULL,
+    score REAL NOT NULL,
+    created_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+# sqlite's default limit on host parameters is 999
+_CHUNK = 500
+
+
+def default_cache_path() -> str:
+    return os.environ.get(COMET_CACHE_ENV) or DEFAULT_CACHE_PATH
+
+
+def triple_key(model: str, src: str, mt: str, ref: str) -> bytes:
+    data = json.dumps([model, src, mt, ref], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).digest()
+
+
+class ScoreCache:
+    def __init__(self, path: str = None, timeout: float = 60) -> None:
+        """Open (and create) a score cache
+
+        Args:
+            path (str): sqlite database file, defaults to $MAD_COMET_CACHE or ~/.cache/mad/comet_scores.sqlite
+            timeout (float): seconds to wait for the database lock
+        """
+        self.path = path or default_cache_path()
+        self.timeout = timeout
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_many(self, keys: "list[bytes]") -> "dict[bytes, float]":
+        found = {}
+        with self._connect() as conn:
+            for i in range(0, len(keys), _CHUNK):
+                chunk = keys[i:i + _CHUNK]
+                rows = conn.execute(f"SELECT key, score FROM scores WHERE key IN ({','.join('?' * len(chunk))})",
+                                    chunk)
+                found.update(rows)
+        return found
+
+    def put_many(self, model: str, scores: "dict[bytes, float]"):
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO scores (key, model, score, created_at) VALUES (?, ?, ?, ?)",
+                             [(key, model, float(score), now) for key, score in scores.items()])
+
+    def stats(self) -> "dict[str, int]":
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT model, COUNT(*) FROM scores GROUP BY model"))
+
+
+def cached_scores(model_key: str, triples: "list[tuple[str, str, str]]", score_fn,
+                  cache: ScoreCache = None) -> "tuple[list[float], dict]":
+    """Score (src, mt, ref) triples, running the model only on distinct triples missing from the cache
+
+    Args:
+        model_key (str): model identity used in the cache key (name plus anything that changes the scores)
+        triples (list[tuple[str, str, str]]): (src, mt, ref) per hypothesis, duplicates allowed
+        score_fn: called as score_fn(srcs, mts, refs) -> list[float] for the missing triples only
+        cache (ScoreCache): persistent cache, None to only deduplicate within this call
+
+    Returns:
+        tuple[list[float], dict]: one score per triple, and counts (total / unique / cached / scored)
+    """
+    keys = [triple_key(model_key, *t) for t in triples]
+    unique = {}
+    for key, t in zip(keys, triples):
+        unique.setdefault(key, t)
+
+    scores = cache.get_many(list(unique)) if cache is not None else {}
+    missing = [key for key in unique if key not in scores]
+    if missing:
+        srcs, mts, refs = zip(*(unique[key] for key in missing))
+        new = dict(zip(missing, score_fn(list(srcs), list(mts), list(refs))))
+        if cache is not None:
+            cache.put_many(model_key, new)
+        scores.update(new)
+
+    stats = {"total": len(triples), "unique": len(unique), "cached": len(unique) - len(missing),
+             "scored": len(missing)}
+    return [scores[key] for key in keys], stats
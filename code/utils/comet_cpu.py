@@ -0,0 +1,162 @@
+"""
+CPU inference for COMET on machines without a GPU.
+
+* dynamic int8 quantization of the encoder's Linear layers (``torch.quantization.quantize_dynamic``),
+  which is where almost all of the CPU time of an XLM-R based COMET model goes;
+* explicit intra-op thread counts, so that N worker processes x T threads match the cores
+  instead of every process grabbing all of them;
+* sharding of the hypotheses across worker processes (spawned, each loads the checkpoint once);
+  shards are dealt round-robin from the length-sorted list so every worker gets the same mix;
+* ``accuracy_check`` compares quantized against full precision scores on a sample.
+
+Quantized scores differ slightly from full precision ones, so they are cached under a
+different model key (see ``model_key``).
+"""
+
+import math
+import multiprocessing
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+QUANT_SUFFIX = "|int8-dynamic"
+
+
+def model_key(model_name: str, quantize: bool) -> str:
+    """Model identity for the score cache"""
+    return model_name + (QUANT_SUFFIX if quantize else "")
+
+
+def default_threads(processes: int) -> int:
+    return max(1, (os.cpu_count() or 1) // max(1, processes))
+
+
+def load_cpu_model(checkpoint: str, quantize: bool = True, threads: int = None):
+    """Load a COMET checkpoint for CPU inference
+
+    Args:
+        checkpoint (str): checkpoint path (from comet.download_model)
+        quantize (bool): dynamic int8 quantization of the Linear layers
+        threads (int): intra-op threads for this process, None keeps the torch default
+    """
+    import torch
+    from comet import load_from_checkpoint  # pip: unbabel-comet
+
+    if threads:
+        torch.set_num_threads(threads)
+    model = load_from_checkpoint(checkpoint)
+    model.eval()
+    if quantize:
+        torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return model
+
+
+def _predict(model, data: List[dict], batch_size: int) -> List[float]:
+    # longest first: batches of similar length need the least padding
+    order = sorted(range(len(data)), key=lambda i: sum(len(v) for v in data[i].values()), reverse=True)
+    out = model.predict([data[i] for i in order], batch_size=batch_size, gpus=0)
+    scores = [0.0] * len(order)
+    for i, score in zip(order, out.scores):
+        scores[i] = score
+    return scores
+
+
+# ----- worker processes -----
+
+_worker_model = None
+
+
+def _init_worker(checkpoint: str, quantize: bool, threads: int):
+    global _worker_model
+    _worker_model = load_cpu_model(checkpoint, quantize, threads)
+
+
+def _score_shard(args: Tuple[List[dict], int]) -> List[float]:
+    data, batch_size = args
+    return _predict(_worker_model, data, batch_size)
+
+
+def predict_cpu(checkpoint: str, srcs: List[str], mts: List[str], refs: List[str], batch_size: int = 16,
+                processes: int = 1, threads: int = None, quantize: bool = True, model=None) -> List[float]:
+    """Score (src, mt, ref) triples on the CPU, optionally sharded across worker processes
+
+    Args:
+        checkpoint (str): checkpoint path (from comet.download_model)
+        srcs, mts, refs (List[str]): triples to score
+        batch_size (int): batch size inside each process
+        processes (int): worker processes; 1 scores in this process
+        threads (int): intra-op threads per process, default cores // processes
+        quantize (bool): dynamic int8 quantization
+        model: already loaded model for processes == 1 (see load_cpu_model)
+
+    Returns:
+        List[float]: one score per triple, in input order
+    """
+    data = [{"src": s, "mt": mt, "ref": r} for s, mt, r in zip(srcs, mts, refs)]
+    threads = threads or default_threads(processes)
+    if processes <= 1 or len(data) < 2 * batch_size:
+        model = model or load_cpu_model(checkpoint, quantize, threads)
+        return _predict(model, data, batch_size)
+
+    # deal the length-sorted items round-robin so every shard has the same length profile
+    order = sorted(range(len(data)), key=lambda i: sum(len(v) for v in data[i].values()), reverse=True)
+    shards = [order[k::processes] for k in range(processes)]
+    ctx = multiprocessing.get_context("spawn")  # torch + fork is not safe
+    with ProcessPoolExecutor(max_workers=processes, mp_context=ctx, initializer=_init_worker,
+                             initargs=(checkpoint, quantize, threads)) as pool:
+        results = pool.map(_score_shard, [([data[i] for i in shard], batch_size) for shard in shards])
+        scores = [0.0] * len(data)
+        for shard, shard_scores in zip(shards, results):
+            for i, score in zip(shard, shard_scores):
+                scores[i] = score
+    return scores
+
+
+def _pearson(x: List[float], y: List[float]) -> float:
+    n = len(x)
+    mx, my = sum(x) / n, sum(y) / n
+    cov = sum((a - mx) * (b - my) for a, b in zip(x, y))
+    sx = math.sqrt(sum((a - mx) ** 2 for a in x))
+    sy = math.sqrt(sum((b - my) ** 2 for b in y))
+    return cov / (sx * sy) if sx and sy else 1.0
+
+
+def _ranks(x: List[float]) -> List[float]:
+    order = sorted(range(len(x)), key=x.__getitem__)
+    ranks = [0.0] * len(x)
+    i = 0
+    while i < len(order):
+        j = i
+        while j + 1 < len(order) and x[order[j + 1]] == x[order[i]]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[order[k]] = (i + j) / 2
+        i = j + 1
+    return ranks
+
+
+def accuracy_check(checkpoint: str, triples: List[Tuple[str, str, str]], sample: int = 200, batch_size: int = 16,
+                   threads: int = None, seed: int = 0) -> dict:
+    """Score a sample with the full precision and the quantized model and compare
+
+    Returns:
+        dict: n, pearson, spearman, mean_abs_diff, max_abs_diff, mean_full, mean_quantized
+    """
+    triples = list(triples)
+    if len(triples) > sample:
+        triples = random.Random(seed).sample(triples, sample)
+    srcs, mts, refs = (list(col) for col in zip(*triples))
+    threads = threads or default_threads(1)
+    full = predict_cpu(checkpoint, srcs, mts, refs, batch_size, processes=1, threads=threads, quantize=False)
+    quant = predict_cpu(checkpoint, srcs, mts, refs, batch_size, processes=1, threads=threads, quantize=True)
+    diffs = [abs(a - b) for a, b in zip(full, quant)]
+    return {
+        "n": len(triples),
+        "pearson": _pearson(full, quant),
+        "spearman": _pearson(_ranks(full), _ranks(quant)),
+        "mean_abs_diff": sum(diffs) / len(diffs),
+        "max_abs_diff": max(diffs),
+        "mean_full": sum(full) / len(full),
+        "mean_quantized": sum(quant) / len(quant),
+    }
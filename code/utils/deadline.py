@@ -0,0 +1,44 @@
+import time
+
+
+class DeadlineExceededException(Exception):
+    "Raised when a debate has used up its latency budget"
+    def __init__(self, budget: float, what: str = ""):
+        super().__init__(f"Deadline of {budget:.1f}s exceeded" + (f" ({what})" if what else ""))
+        self.budget = budget
+
+
+class Deadline:
+    def __init__(self, seconds: float = None) -> None:
+        """A latency budget shared by every call of one debate
+
+        Args:
+            seconds (float): budget in seconds, None means no deadline
+        """
+        self.budget = seconds
+        self.start = time.monotonic()
+        self.expires = None if seconds is None else self.start + seconds
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    def remaining(self) -> "float | None":
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.expires is not None and time.monotonic() >= self.expires
+
+    def check(self, what: str = ""):
+        if self.expired():
+            raise DeadlineExceededException(self.budget, what)
+
+    def timeout(self, call_timeout: float = None) -> "float | None":
+        """Timeout for the next call: the per-call timeout capped by the remaining budget"""
+        remaining = self.remaining()
+        if remaining is None:
+            return call_timeout
+        if call_timeout is None:
+            return remaining
+        return min(call_timeout, remaining)
@@ -0,0 +1,68 @@
+import math
+import re
+
+# models whose API rejects the logprobs parameter; their decisions are read from the text only
+NO_LOGPROBS_MODELS = {"deepseek-reasoner"}
+# models that reason before answering: a few-token decision call is used up by the reasoning and comes
+# back empty, so their moderator keeps one full verdict per round
+REASONING_MODELS = {"deepseek-reasoner"}
+
+_ANSWER_RE = re.compile(r"\W*(yes|no)\b", re.IGNORECASE)
+
+
+class ModeratorDecision:
+    def __init__(self, enabled: bool = False, max_tokens: int = 3, logprobs: bool = True,
+                 threshold: float = 0.5) -> None:
+        """Two-step moderator: a few-token Yes/No "is there a clear preference" call after every
+        round, and the full JSON verdict (Reason, translation / answer) only when it says Yes
+
+        Args:
+            enabled (bool): two-step mode; off (and for reasoning models) keeps one full verdict per round
+            max_tokens (int): max_tokens of the decision call
+            logprobs (bool): decide on P(Yes) from the first token's logprobs rather than the text
+            threshold (float): P(Yes) needed to end the debate
+        """
+        self.enabled = enabled
+        self.max_tokens = max_tokens
+        self.logprobs = logprobs
+        self.threshold = threshold
+
+    @classmethod
+    def from_config(cls, config: dict) -> "ModeratorDecision":
+        """Build from the "moderator_decision" entry of a prompt config"""
+        return cls(**(config.get("moderator_decision") or {}))
+
+    def active(self, model_name: str) -> bool:
+        """Two-step mode for a moderator on this model"""
+        return self.enabled and model_name not in REASONING_MODELS
+
+    def use_logprobs(self, model_name: str) -> bool:
+        return self.logprobs and model_name not in NO_LOGPROBS_MODELS
+
+    def parse(self, text: str, logprobs=None) -> "tuple[bool | None, float | None]":
+        """(decision, P(Yes)); decision is None when the answer is neither Yes nor No"""
+        p_yes = yes_probability(logprobs)
+        if p_yes is not None:
+            return p_yes >= self.threshold, p_yes
+        m = _ANSWER_RE.match(text or "")
+        if m is None:
+            return None, None
+        return m.group(1).lower() == "yes", None
+
+
+def yes_probability(logprobs) -> "float | None":
+    """P(Yes) / (P(Yes) + P(No)) over the top alternatives of the first generated token"""
+    content = getattr(logprobs, "content", None)
+    if not content:
+        return None
+    first = content[0]
+    p_yes = p_no = 0.0
+    for candidate in getattr(first, "top_logprobs", None) or [first]:
+        word = candidate.token.strip().lower()
+        if word.startswith("yes"):
+            p_yes += math.exp(candidate.logprob)
+        elif word.startswith("no"):
+            p_no += math.exp(candidate.logprob)
+    if p_yes + p_no == 0:
+        return None
+    return p_yes / (p_yes + p_no)
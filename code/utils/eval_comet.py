@@ -2,11 +2,26 @@ import argparse
 import glob
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from typing import Any, Dict, List
 
 import pandas as pd
-from comet import download_model, load_from_checkpoint  # pip: unbabel-comet
+
+try:
+    import orjson  # 可选：解析大批 json 快很多
+except ImportError:
+    orjson = None
+
+if __package__:
+    from .comet_cache import ScoreCache, cached_scores, default_cache_path
+    from .comet_cpu import accuracy_check, default_threads, load_cpu_model, model_key, predict_cpu
+    from .significance import compare_pair, pairwise
+else:
+    from comet_cache import ScoreCache, cached_scores, default_cache_path
+    from comet_cpu import accuracy_check, default_threads, load_cpu_model, model_key, predict_cpu
+    from significance import compare_pair, pairwise
 
 
 @dataclass
@@ -18,24 +33,87 @@ class Example:
     debate: str
     path: str
 
+# 不同版本的结果文件字段名不同（MAD_Debate_Process 里是 "base translation" 等）
+FIELD_ALIASES = {
+    "source": ("source",),
+    "reference": ("reference", "correct reference"),
+    "base_translation": ("base_translation", "base translation"),
+    "debate_translation": ("debate_translation", "debate translation"),
+}
+
+
+@dataclass
+class System:
+    name: str
+    ids: List[int]
+    srcs: List[str]
+    mts: List[str]
+    refs: List[str]
+
+
 def load_json_robust(path):
     """
     Robust JSON loader for Windows:
-    try UTF-8 first, fallback to GBK.
+    read the bytes once, decode as UTF-8 and fall back to GBK.
     """
+    with open(path, "rb") as f:
+        data = f.read()
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        text = data.decode("utf-8")
     except UnicodeDecodeError:
-        with open(path, "r", encoding="gbk") as f:
-            return json.load(f)
+        text = data.decode("gbk")
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def get_field(obj: Dict[str, Any], name: str) -> str:
+    for key in FIELD_ALIASES[name]:
+        if key in obj:
+            return str(obj[key] or "").strip()
+    return ""
+
+def load_examples_from_pack(pack_path: str) -> List[Example]:
+    """
+    从 transcript_store 的 .madpack 读取，只解码需要的四个字段，不解析完整辩论记录。
+    """
+    if __package__:
+        from .transcript_store import TranscriptStore
+    else:
+        from transcript_store import TranscriptStore
+
+    with TranscriptStore(pack_path) as store:
+        columns = []
+        for name in ("source", "reference", "base_translation", "debate_translation"):
+            # 取包里实际存在的别名列；都不存在时不调用 store.field，否则会逐条解码完整记录
+            key = next((k for k in FIELD_ALIASES[name] if k in store.fields), None)
+            columns.append(store.field(key) if key else [None] * len(store.keys))
+        keys = store.keys
+
+    examples: List[Example] = []
+    for key, src, ref, base, debate in zip(keys, *columns):
+        if not key.isdigit():
+            continue
+        src, ref, base, debate = (str(v or "").strip() for v in (src, ref, base, debate))
+        if not src or not ref or not base or not debate:
+            continue
+        examples.append(Example(int(key), src, ref, base, debate, f"{pack_path}#{key}"))
+    return examples
+
 
-def load_examples(output_dir: str) -> List[Example]:
+def load_examples(output_dir: str, workers: int = 8) -> List[Example]:
     """
     读取 output_dir 下的 0.json, 1.json...（只认纯数字文件名）
     跳过 0-config.json 等。
     需要字段：source / reference / base_translation / debate_translation
+    output_dir 也可以是 transcript_store 打包的 .madpack 文件。
     """
+    if os.path.isfile(output_dir) and output_dir.endswith(".madpack"):
+        examples = load_examples_from_pack(output_dir)
+        if not examples:
+            raise RuntimeError(f"No valid examples in {output_dir}")
+        return examples
+
     files = glob.glob(os.path.join(output_dir, "*.json"))
 
     numbered = []
@@ -49,15 +127,18 @@ def load_examples(output_dir: str) -> List[Example]:
     if not numbered:
         raise RuntimeError(f"No numbered json files found in {output_dir}")
 
+    # 文件多时用线程池并行读取/解析
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        objs = list(pool.map(load_json_robust, numbered))
+
     examples: List[Example] = []
-    for p in numbered:
+    for p, obj in zip(numbered, objs):
         idx = int(os.path.splitext(os.path.basename(p))[0])
-        obj: Dict[str, Any] = load_json_robust(p)
 
-        src = str(obj.get("source", "")).strip()
-        ref = str(obj.get("reference", "")).strip()
-        base = str(obj.get("base_translation", "")).strip()
-        debate = str(obj.get("debate_translation", "")).strip()
+        src = get_field(obj, "source")
+        ref = get_field(obj, "reference")
+        base = get_field(obj, "base_translation")
+        debate = get_field(obj, "debate_translation")
 
         # COMET(da) 必须有 reference；base/debate 为空也没法算
         if not src or not ref or not base or not debate:
@@ -74,22 +155,239 @@ def load_examples(output_dir: str) -> List[Example]:
     return examples
 
 
+def download_checkpoint(name: str) -> str:
+    # 只有缓存未命中时才需要加载模型（comet/torch 导入很慢）
+    from comet import download_model  # pip: unbabel-comet
+
+    return download_model(name)
+
+
+def load_model(name: str):
+    from comet import load_from_checkpoint  # pip: unbabel-comet
+
+    return load_from_checkpoint(download_checkpoint(name))
+
+
 def predict_scores(model, srcs: List[str], mts: List[str], refs: List[str], batch_size: int) -> List[float]:
-    data = [{"src": s, "mt": mt, "ref": r} for s, mt, r in zip(srcs, mts, refs)]
+    # 按长度排序后再分 batch，同一 batch 里 padding 最少；结果按原顺序返回
+    order = sorted(range(len(mts)), key=lambda i: len(srcs[i]) + len(mts[i]) + len(refs[i]), reverse=True)
+    data = [{"src": srcs[i], "mt": mts[i], "ref": refs[i]} for i in order]
     gpus = 1 if getattr(model, "device", None) is not None and getattr(model.device, "type", "") == "cuda" else 0
     out = model.predict(data, batch_size=batch_size, gpus=gpus)
-    return list(out.scores)
+    scores = [0.0] * len(order)
+    for i, score in zip(order, out.scores):
+        scores[i] = score
+    return scores
+
+
+def cache_key(args) -> str:
+    # 量化模型的分数和全精度略有不同，缓存里分开存
+    return model_key(args.model, args.cpu and not args.no_quantize)
+
+
+def make_score_fn(args, threads: int):
+    """score_fn for cached_scores: loads the model on first use, i.e. only when something is not cached"""
+    model = None
+
+    def score_fn(s, m, r):
+        nonlocal model
+        if args.cpu:
+            ckpt = download_checkpoint(args.model)
+            if model is None and args.processes <= 1:
+                model = load_cpu_model(ckpt, quantize=not args.no_quantize, threads=threads)
+            return predict_cpu(ckpt, s, m, r, batch_size=args.batch_size, processes=args.processes,
+                               threads=threads, quantize=not args.no_quantize, model=model)
+        if model is None:
+            model = load_model(args.model)
+        return predict_scores(model, s, m, r, batch_size=args.batch_size)
+
+    return score_fn
+
+
+def score_all(args, triples: List[tuple]) -> List[float]:
+    """cpu_check（可选）+ 去重/缓存打分，打印统计"""
+    # 线程数只解析一次：抽样检查、预加载模型和 predict_cpu 用同一个值
+    threads = args.threads or default_threads(args.processes)
+    if args.cpu and args.cpu_check and not args.no_quantize:
+        check = accuracy_check(download_checkpoint(args.model), list(dict.fromkeys(triples)), sample=args.cpu_check,
+                               batch_size=args.batch_size, threads=threads)
+        print(f"int8 vs fp32 on {check['n']} hypotheses: pearson={check['pearson']:.4f} "
+              f"spearman={check['spearman']:.4f} mean|Δ|={check['mean_abs_diff']:.4f} "
+              f"max|Δ|={check['max_abs_diff']:.4f} mean {check['mean_full']:.4f} -> {check['mean_quantized']:.4f}")
+        if check["pearson"] < args.cpu_check_min_pearson:
+            raise RuntimeError(f"Quantized scores deviate too much (pearson {check['pearson']:.4f} < "
+                               f"{args.cpu_check_min_pearson}); rerun with --no_quantize")
+
+    cache = None if args.no_cache else ScoreCache(args.cache)
+    start = time.time()
+    scores, stats = cached_scores(cache_key(args), triples, make_score_fn(args, threads), cache)
+    print(f"Hypotheses: {stats['total']}, unique: {stats['unique']}, "
+          f"from cache: {stats['cached']}, scored now: {stats['scored']} ({time.time() - start:.1f}s)")
+    return scores
+
+
+def read_lines(path: str) -> List[str]:
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        text = data.decode("gbk")
+    return [l.strip() for l in text.splitlines()]
+
+
+def load_system(name: str, path: str, srcs: List[str], refs: List[str], workers: int) -> List[System]:
+    """
+    一个系统可以是：
+    - 纯文本文件：每行一个译文，与 --src / --ref 逐行对齐（如 Lexical_Ambiguity/output/mad）
+    - 辩论结果目录或 .madpack：得到两个系统 name（debate_translation）和 name:base（base_translation）
+    """
+    if os.path.isfile(path) and not path.endswith(".madpack"):
+        if srcs is None or refs is None:
+            raise RuntimeError(f"{path} is a plain text system; --src and --ref are required")
+        mts = read_lines(path)
+        if len(mts) != len(srcs):
+            raise RuntimeError(f"{path} has {len(mts)} lines, expected {len(srcs)} (lines of --src)")
+        keep = [i for i, mt in enumerate(mts) if mt and srcs[i] and refs[i]]
+        return [System(name, keep, [srcs[i] for i in keep], [mts[i] for i in keep], [refs[i] for i in keep])]
+
+    examples = sorted(load_examples(path, workers), key=lambda x: x.idx)
+    ids = [e.idx for e in examples]
+    srcs_, refs_ = [e.src for e in examples], [e.ref for e in examples]
+    return [System(name, ids, srcs_, [e.debate for e in examples], refs_),
+            System(f"{name}:base", ids, srcs_, [e.base for e in examples], refs_)]
+
+
+def system_paths(args) -> List[tuple]:
+    paths = []
+    if args.systems_dir:
+        for entry in sorted(os.listdir(args.systems_dir)):
+            # *.csv 是评测结果（comet_scores.csv 等），不是系统输出
+            if not entry.startswith(".") and not entry.endswith(".csv"):
+                paths.append((os.path.splitext(entry)[0] if entry.endswith(".madpack") else entry,
+                              os.path.join(args.systems_dir, entry)))
+    for spec in args.systems or []:
+        name, _, path = spec.rpartition("=")
+        paths.append((name or os.path.basename(os.path.normpath(path)), path))
+    return paths
+
+
+def significance_table(rows: List[dict]) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=["system_a", "system_b", "n", "delta", "ci_low", "ci_high", "win_share",
+                                       "p_value", "p_value_ar"])
+
+
+def print_significance(table: pd.DataFrame, args):
+    print(f"\n===== Paired significance ({args.resamples} resamples, {1 - args.alpha:.0%} CI) =====")
+    print(table.to_string(index=False, float_format=lambda x: f"{x:.4f}"))
+
+
+def evaluate_systems(args):
+    """多系统模式：并行读取所有系统，去重/查缓存后一次性打分，输出对比表"""
+    srcs = read_lines(args.src) if args.src else None
+    refs = read_lines(args.ref) if args.ref else None
+    if srcs is not None and refs is not None and len(srcs) != len(refs):
+        raise RuntimeError(f"--src has {len(srcs)} lines but --ref has {len(refs)}")
+
+    paths = system_paths(args)
+    if not paths:
+        raise RuntimeError("No systems given (--systems / --systems_dir)")
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        loaded = list(pool.map(lambda np: load_system(np[0], np[1], srcs, refs, args.workers), paths))
+    systems = [s for group in loaded for s in group]
+
+    triples = [t for s in systems for t in zip(s.srcs, s.mts, s.refs)]
+    print(f"Scoring {len(systems)} systems, {len(triples)} hypotheses")
+    print(f"COMET model: {args.model}")
+    scores = score_all(args, triples)
+
+    rows, start = [], 0
+    for s in systems:
+        for i, mt, score in zip(s.ids, s.mts, scores[start:start + len(s.mts)]):
+            rows.append({"system": s.name, "id": i, "translation": mt, "comet": score})
+        start += len(s.mts)
+    long_df = pd.DataFrame(rows)
+    wide = long_df.pivot(index="id", columns="system", values="comet")
+
+    names = [s.name for s in systems]
+    baseline = args.baseline_system if args.baseline_system in names else None
+    # 所有系统两两比较（paired bootstrap + approximate randomization）
+    pairs = []
+    if args.resamples:
+        pairs = pairwise({name: wide[name].to_numpy() for name in names}, args.resamples, args.alpha, args.seed)
+    vs_baseline = {}
+    for p in pairs:
+        if p["system_b"] == baseline:
+            vs_baseline[p["system_a"]] = (p["ci_low"], p["ci_high"], p["p_value"], p["p_value_ar"])
+        elif p["system_a"] == baseline:
+            vs_baseline[p["system_b"]] = (-p["ci_high"], -p["ci_low"], p["p_value"], p["p_value_ar"])
+    table = []
+    for name in names:
+        row = {"system": name, "N": int(wide[name].notna().sum()), "COMET": float(wide[name].mean())}
+        if baseline is not None:
+            delta = (wide[name] - wide[baseline]).dropna()
+            row[f"Δ vs {baseline}"] = float(delta.mean())
+            row[f"win-rate vs {baseline}"] = float((delta > 0).mean())
+            if name in vs_baseline:
+                row["CI low"], row["CI high"], row["p (bootstrap)"], row["p (AR)"] = vs_baseline[name]
+        table.append(row)
+    table = pd.DataFrame(table).sort_values("COMET", ascending=False)
+
+    print("\n===== COMET Summary (systems) =====")
+    print(table.to_string(index=False, float_format=lambda x: f"{x:.4f}"))
+    if pairs:
+        print_significance(significance_table(pairs), args)
+
+    out_dir = args.out_dir or "."
+    out_csv = args.out_csv if os.path.isabs(args.out_csv) else os.path.join(out_dir, args.out_csv)
+    table_csv = os.path.splitext(out_csv)[0] + "_summary.csv"
+    long_df.to_csv(out_csv, index=False, encoding="utf-8-sig")
+    table.to_csv(table_csv, index=False, encoding="utf-8-sig")
+    print(f"\nSaved per-sentence scores to: {out_csv}")
+    print(f"Saved comparison table to: {table_csv}")
+    if pairs:
+        sig_csv = os.path.splitext(out_csv)[0] + "_significance.csv"
+        significance_table(pairs).to_csv(sig_csv, index=False, encoding="utf-8-sig")
+        print(f"Saved pairwise significance to: {sig_csv}")
 
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--output_dir", required=True, help="例如：data/lexical_output 或 lexical_output")
+    ap.add_argument("--output_dir", default=None, help="例如：data/lexical_output 或 lexical_output（也可以是 .madpack 文件）")
     ap.add_argument("--model", default="Unbabel/wmt22-comet-da", help="论文常用 reference-based COMET")
     ap.add_argument("--batch_size", type=int, default=8, help="显存/内存不够可调小到 4/2")
     ap.add_argument("--out_csv", default="comet_scores.csv", help="输出 CSV 文件名（默认写在 output_dir 里）")
+    ap.add_argument("--cache", default=None, help=f"分数缓存（sqlite），默认 $MAD_COMET_CACHE 或 {default_cache_path()}")
+    ap.add_argument("--no_cache", action="store_true", help="不读写分数缓存（同一次运行内仍然去重）")
+    ap.add_argument("--workers", type=int, default=8, help="读取/解析结果文件的线程数")
+    # 多系统模式：模型只加载一次，所有系统一起打分
+    ap.add_argument("--systems_dir", default=None, help="多系统模式：目录下每个文件/子目录/.madpack 是一个系统，"
+                                                        "例如 data/CommonMT/Lexical_Ambiguity/output")
+    ap.add_argument("--out_dir", default=None, help="多系统模式的输出目录（默认当前目录，不写进 --systems_dir）")
+    ap.add_argument("--systems", nargs="*", default=None, help="多系统模式：额外的系统 [name=]path")
+    ap.add_argument("--src", default=None, help="纯文本系统对应的源文件，例如 raw/lexical.zh-en.zh")
+    ap.add_argument("--ref", default=None, help="纯文本系统对应的参考译文，例如 raw/lexical.zh-en.en")
+    ap.add_argument("--baseline_system", default="baseline", help="对比表里 Δ / win-rate 的基准系统")
+    # 显著性检验
+    ap.add_argument("--resamples", type=int, default=10000, help="bootstrap / approximate randomization 的重采样次数（0 = 不做）")
+    ap.add_argument("--alpha", type=float, default=0.05, help="置信区间为 1 - alpha")
+    ap.add_argument("--seed", type=int, default=0, help="重采样随机种子")
+    # 无 GPU 的机器：int8 动态量化 + 多进程分片
+    ap.add_argument("--cpu", action="store_true", help="CPU 模式：int8 动态量化、限定线程数、多进程分片")
+    ap.add_argument("--no_quantize", action="store_true", help="CPU 模式下不量化（全精度）")
+    ap.add_argument("--processes", type=int, default=1, help="CPU 模式的进程数（每个进程各加载一次模型）")
+    ap.add_argument("--threads", type=int, default=None, help="每个进程的 torch 线程数，默认 CPU 核数 / 进程数")
+    ap.add_argument("--cpu_check", type=int, default=0, help="先抽样 N 条比较量化与全精度分数（0 = 不检查）")
+    ap.add_argument("--cpu_check_min_pearson", type=float, default=0.99, help="抽样检查的最低 Pearson 相关")
     args = ap.parse_args()
 
-    examples = load_examples(args.output_dir)
+    if args.systems_dir or args.systems:
+        evaluate_systems(args)
+        return
+    if not args.output_dir:
+        ap.error("--output_dir is required (or use --systems_dir / --systems)")
+
+    examples = load_examples(args.output_dir, args.workers)
     examples = sorted(examples, key=lambda x: x.idx)
 
     srcs = [e.src for e in examples]
@@ -100,11 +398,10 @@ def main():
     print(f"Scoring {len(examples)} examples from: {args.output_dir}")
     print(f"COMET model: {args.model}")
 
-    ckpt = download_model(args.model)
-    model = load_from_checkpoint(ckpt)
-
-    base_scores = predict_scores(model, srcs, base_mts, refs, batch_size=args.batch_size)
-    debate_scores = predict_scores(model, srcs, debate_mts, refs, batch_size=args.batch_size)
+    # base 和 debate 一起打分：相同的 (src, mt, ref) 只算一次，已缓存的不再算
+    triples = list(zip(srcs, base_mts, refs)) + list(zip(srcs, debate_mts, refs))
+    scores = score_all(args, triples)
+    base_scores, debate_scores = scores[:len(examples)], scores[len(examples):]
 
     df = pd.DataFrame({
         "id": [e.idx for e in examples],
@@ -128,12 +425,24 @@ def main():
     print(f"COMET(debate) mean = {mean_debate:.4f}")
     print(f"Δ (debate-base) mean = {mean_delta:.4f}")
     print(f"Win-rate (debate > base) = {win_rate:.2%}")
+    sig = None
+    if args.resamples:
+        sig = compare_pair(df["comet_debate"].to_numpy(), df["comet_base"].to_numpy(), args.resamples, args.alpha,
+                           args.seed)
+        print(f"Δ {1 - args.alpha:.0%} CI (paired bootstrap) = [{sig['ci_low']:.4f}, {sig['ci_high']:.4f}]")
+        print(f"p-value: bootstrap = {sig['p_value']:.4f}, approximate randomization = {sig['p_value_ar']:.4f}")
 
     out_csv = args.out_csv
     if not os.path.isabs(out_csv):
-        out_csv = os.path.join(args.output_dir, out_csv)
+        out_dir = args.output_dir if os.path.isdir(args.output_dir) else os.path.dirname(args.output_dir)
+        out_csv = os.path.join(out_dir, out_csv)
     df.to_csv(out_csv, index=False, encoding="utf-8-sig")
     print(f"\nSaved per-sentence scores to: {out_csv}")
+    if sig is not None:
+        sig_csv = os.path.splitext(out_csv)[0] + "_significance.csv"
+        significance_table([{"system_a": "debate", "system_b": "base", **sig}]).to_csv(sig_csv, index=False,
+                                                                                      encoding="utf-8-sig")
+        print(f"Saved significance to: {sig_csv}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,150 @@
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from . import tracing
+
+# pool threads per running debate: up to two calls in flight (the seeded first round), each with a hedge
+THREADS_PER_DEBATE = 4
+
+
+class Hedger:
+    def __init__(self, enabled: bool = False, percentile: float = 0.95, min_samples: int = 20,
+                 max_extra: float = 0.1, min_delay: float = 1.0, window: int = 500, workers: int = 32) -> None:
+        """Hedged API calls: when a call is still running after the observed ``percentile`` latency
+        of its role, send the same request again and return whichever answer comes first
+
+        The loser cannot be aborted mid-request with the synchronous client; its result is
+        discarded (and its latency still observed when it completes).  Hedges are capped at
+        ``max_extra`` times the number of calls, so a slow API cannot double the load.
+
+        Args:
+            enabled (bool): hedge at all; when off calls run inline as before
+            percentile (float): percentile of observed latencies used as the hedge delay
+            min_samples (int): latencies of a role needed before its calls are hedged
+            max_extra (float): cap on hedged requests as a fraction of all calls
+            min_delay (float): smallest hedge delay in seconds
+            window (int): number of recent latencies kept per role
+            workers (int): threads running the requests; from_config raises it to fit the runner's
+                concurrency, since a primary waiting for a free thread would look slow and get hedged
+        """
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_extra = max_extra
+        self.min_delay = min_delay
+        self.window = window
+        self.workers = workers
+        self._history = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._pool = None
+
+    @classmethod
+    def from_config(cls, config: dict, concurrency: int = 1) -> "Hedger":
+        """Build from the "hedging" entry of a prompt config, for ``concurrency`` debates running at once"""
+        hedger = cls(**(config.get("hedging") or {}))
+        hedger.workers = max(hedger.workers, THREADS_PER_DEBATE * concurrency)
+        return hedger
+
+    def delay(self, role: str) -> "float | None":
+        """Seconds after which a call of this role is hedged, None while there are too few samples"""
+        with self._lock:
+            history = sorted(self._history.get(role, ()))
+        if len(history) < self.min_samples:
+            return None
+        return max(self.min_delay, history[max(0, math.ceil(self.percentile * len(history)) - 1)])
+
+    def _observe(self, role: str, seconds: float):
+        with self._lock:
+            self._history.setdefault(role, deque(maxlen=self.window)).append(seconds)
+
+    def _count(self, role: str, key: str, value: float = 1):
+        with self._lock:
+            stats = self._stats.setdefault(role, {"calls": 0, "hedged": 0, "hedge_won": 0, "saved_seconds": 0.0})
+            stats[key] += value
+
+    def _take_budget(self, role: str) -> bool:
+        with self._lock:
+            calls = sum(s["calls"] for s in self._stats.values())
+            hedged = sum(s["hedged"] for s in self._stats.values())
+            if hedged + 1 > self.max_extra * calls:
+                return False
+            self._stats[role]["hedged"] += 1
+            return True
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hedge")
+            return self._pool
+
+    def _timed(self, fn):
+        start = time.monotonic()
+        result = fn()
+        return result, time.monotonic() - start
+
+    def call(self, role: str, fn):
+        """Run ``fn()`` (an API request), hedged if enabled and this role has enough latency samples"""
+        self._count(role, "calls")
+        delay = self.delay(role) if self.enabled else None
+        if delay is None:
+            result, seconds = self._timed(fn)
+            self._observe(role, seconds)
+            return result
+
+        started = threading.Event()
+
+        def run():
+            started.set()
+            return fn()
+
+        primary = self._executor().submit(tracing.bind(self._timed), run)
+        # the hedge delay counts from the request going out, not from waiting for a pool thread
+        started.wait()
+        start = time.monotonic()
+        # the primary's latency is observed whenever it ends, also after losing to the hedge,
+        # so the delay keeps tracking the real latency distribution
+        def observe(f):
+            if not f.cancelled() and f.exception() is None:
+                self._observe(role, f.result()[1])
+
+        primary.add_done_callback(observe)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._take_budget(role):
+            return primary.result()[0]
+
+        tracing.instant("hedge", role=role, delay=round(delay, 3))
+        hedge = self._executor().submit(tracing.bind(self._timed), fn)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                for other in pending:
+                    other.cancel()
+                if future is hedge:
+                    self._count(role, "hedge_won")
+                    won_at = time.monotonic() - start
+
+                    def saved(f):
+                        if not f.cancelled() and f.exception() is None:
+                            self._count(role, "saved_seconds", f.result()[1] - won_at)
+
+                    primary.add_done_callback(saved)
+                return future.result()[0]
+        raise error
+
+    def summary(self) -> dict:
+        with self._lock:
+            stats = {role: dict(s) for role, s in self._stats.items()}
+        for role, s in stats.items():
+            s["hedge_rate"] = round(s["hedged"] / s["calls"], 4) if s["calls"] else 0.0
+            s["saved_seconds"] = round(s["saved_seconds"], 3)
+            s["delay"] = self.delay(role)
+        return stats
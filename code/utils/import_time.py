@@ -0,0 +1,78 @@
+"""
+Import-time report for the debate entry points (regression check for CLI startup).
+
+Runs each entry module in a fresh interpreter with ``python -X importtime``, prints the
+slowest imports and fails when the total exceeds a budget or when a heavy dependency
+that should be imported lazily shows up at import time.
+
+    python code/utils/import_time.py
+    python code/utils/import_time.py --budget-ms 150 --top 15
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+MAD_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# (module to import, directory it is imported from)
+ENTRY_POINTS = {
+    "debate4tran": os.path.join(MAD_path, "code"),
+    "interactive": MAD_path,
+}
+
+# these are only needed once a debate actually runs
+LAZY_MODULES = ["openai", "backoff", "tiktoken", "langcodes", "tqdm"]
+
+
+def measure(module: str, cwd: str) -> "list[tuple[str, int, int]]":
+    """Import ``module`` in a subprocess and return (name, self_us, cumulative_us) for its import subtree"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=cwd,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        # import time:       self [us] |   cumulative | imported package
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name[1:], int(self_us), int(cumulative_us)))
+    # nested imports are listed (indented) right before their parent; drop interpreter startup
+    # (site, .pth hooks) by keeping only the rows after the last top-level import before the target
+    end = next(i for i, (name, _, _) in enumerate(rows) if name == module)
+    start = max([i + 1 for i, (name, _, _) in enumerate(rows[:end]) if not name.startswith(" ")], default=0)
+    return [(name.strip(), s, c) for name, s, c in rows[start:end + 1]]
+
+
+def report(module: str, cwd: str, top: int, budget_ms: float) -> bool:
+    rows = measure(module, cwd)
+    total_ms = next(c for name, _, c in rows if name == module) / 1000
+    imported = {name.split(".")[0] for name, _, _ in rows}
+    eager = [m for m in LAZY_MODULES if m in imported]
+
+    print(f"===== import {module}: {total_ms:.1f} ms (budget {budget_ms:.0f} ms) =====")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda r: -r[2])[:top]:
+        print(f"{cumulative_us / 1000:9.1f} ms  {self_us / 1000:8.1f} ms self  {name}")
+    if eager:
+        print(f"FAIL: imported eagerly: {', '.join(eager)}")
+    if total_ms > budget_ms:
+        print(f"FAIL: {total_ms:.1f} ms exceeds the {budget_ms:.0f} ms budget")
+    print()
+    return not eager and total_ms <= budget_ms
+
+
+def main():
+    parser = argparse.ArgumentParser("Import-time regression check")
+    parser.add_argument("--modules", nargs="+", default=list(ENTRY_POINTS), choices=list(ENTRY_POINTS))
+    parser.add_argument("--budget-ms", type=float, default=200, help="Max cumulative import time per entry point")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to list")
+    args = parser.parse_args()
+
+    ok = all([report(m, ENTRY_POINTS[m], args.top, args.budget_ms) for m in args.modules])
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,30 @@
-from pathlib import Path
+"""
+合并 lexical.zh-en.zh / lexical.zh-en.en 为 debate4tran.py 的输入 TSV（source \t reference）。
 
-# ===== 路径（已为你写死成你的实际路径）=====
-zh_path = Path(r"D:\PycharmProjects\Multi-Agents-Debate\data\lexical.zh-en.zh")
-en_path = Path(r"D:\PycharmProjects\Multi-Agents-Debate\data\lexical.zh-en.en")
-out_path = Path(r"D:\PycharmProjects\Multi-Agents-Debate\data\lexical.zh-en.tsv")
-# ===========================================
+现在只是 prepare_corpus.py 的一个预设：逐行流式读取、边读边检查对齐，并在旁边写
+lexical.zh-en.manifest.json（行数 + sha256）。更大的语料、去重、gzip/JSONL、分片请直接用
+prepare_corpus.py。
+"""
+import argparse
+import os
 
-# 读取文件
-zh_lines = zh_path.read_text(encoding="utf-8").splitlines()
-en_lines = en_path.read_text(encoding="utf-8").splitlines()
+if __package__:
+    from .prepare_corpus import prepare
+else:
+    from prepare_corpus import prepare
 
-# 去除首尾空白（不删行，保证一一对应）
-zh_lines = [l.strip() for l in zh_lines]
-en_lines = [l.strip() for l in en_lines]
+here = os.path.dirname(os.path.abspath(__file__))
 
-# 行数一致性检查（非常重要）
-if len(zh_lines) != len(en_lines):
-    raise ValueError(
-        f"Line count mismatch: zh={len(zh_lines)}, en={len(en_lines)}"
-    )
+parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument("--zh", default=os.path.join(here, "lexical.zh-en.zh"), help="中文（源语言）文件")
+parser.add_argument("--en", default=os.path.join(here, "lexical.zh-en.en"), help="英文（参考译文）文件")
+parser.add_argument("-o", "--out", default=os.path.join(here, "lexical.zh-en.tsv"), help="输出 TSV")
+args = parser.parse_args()
 
-# 写 TSV：source \t reference
-with out_path.open("w", encoding="utf-8", newline="\n") as f:
-    for zh, en in zip(zh_lines, en_lines):
-        f.write(f"{zh}\t{en}\n")
+# 和原来一样：只去首尾空白（不做 Unicode 规范化、不删控制字符、不合并空白），不删行、不去重，保证与输入一一对应
+out_dir, name = os.path.split(os.path.abspath(args.out))
+manifest = prepare(args.zh, args.en, out_dir, prefix=os.path.splitext(name)[0], fmt="tsv",
+                   unicode_form=None, dedupe=False, keep_empty=True, clean=False, name=name)
 
-print(f"✅ Merged {len(zh_lines)} lines")
-print(f"📄 Output written to: {out_path}")
+print(f"✅ Merged {manifest['stats']['written']} lines")
+print(f"📄 Output written to: {os.path.join(out_dir, manifest['shards'][0]['path'])}")
@@ -0,0 +1,98 @@
+from .openai_utils import model2price
+from .token_budget import ROLES
+
+
+class ModelRouter:
+    def __init__(self, default_model: str, role_models: dict = None, escalation: dict = None,
+                 prices: dict = None) -> None:
+        """Which model each debate role runs on, and where to escalate
+
+        Roles without an entry use the debate's model.  ``escalation`` names a stronger model
+        per role that is only called when the cheap one could not decide: for the moderator,
+        when its verdict after the last round still has no preference (one expensive call,
+        which usually saves the two judge calls).  Both are opt-in: the shipped configs leave
+        "role_models" and "escalation" empty, so every role runs on the debate's model.
+
+        Args:
+            default_model (str): model of roles without an entry (the debate's model_name)
+            role_models (dict): role -> model, e.g. {"judge": "deepseek-reasoner"}
+            escalation (dict): role -> escalation model, e.g. {"moderator": "deepseek-reasoner"}
+            prices (dict): model -> (prompt, completion) USD per 1M tokens, on top of model2price
+        """
+        self.default_model = default_model
+        self.role_models = {role: m for role, m in (role_models or {}).items() if m}
+        self.escalation = {role: m for role, m in (escalation or {}).items() if m}
+        self.prices = dict(model2price)
+        self.prices.update({m: tuple(p) for m, p in (prices or {}).items()})
+
+    @classmethod
+    def from_config(cls, config: dict, default_model: str) -> "ModelRouter":
+        """Build from the "role_models" / "escalation" / "model_prices" entries of a prompt config"""
+        return cls(default_model, config.get("role_models"), config.get("escalation"), config.get("model_prices"))
+
+    def model(self, role: str) -> str:
+        return self.role_models.get(role, self.default_model)
+
+    def escalation_model(self, role: str) -> "str | None":
+        model = self.escalation.get(role)
+        return model if model and model != self.model(role) else None
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> "float | None":
+        price = self.prices.get(model)
+        if price is None:
+            return None
+        return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1e6
+
+    def role_stats(self, players) -> dict:
+        """Calls, tokens, API seconds and cost per role of one debate
+
+        Players that ran on another model than their role's (the escalation model) are
+        reported separately as "role@model".
+        """
+        stats = {}
+        for player in players:
+            role = player.role or player.name
+            if player.model_name != self.model(role):
+                role = f"{role}@{player.model_name}"
+            entry = stats.setdefault(role, {"model": player.model_name, "calls": 0, "prompt_tokens": 0,
+                                            "completion_tokens": 0, "seconds": 0.0, "cost": 0.0})
+            for key in ("calls", "prompt_tokens", "completion_tokens", "seconds"):
+                entry[key] += player.usage.get(key, 0)
+            cost = self.cost(player.model_name, player.usage["prompt_tokens"], player.usage["completion_tokens"])
+            entry["cost"] = None if cost is None or entry["cost"] is None else entry["cost"] + cost
+        for entry in stats.values():
+            entry["seconds"] = round(entry["seconds"], 3)
+        return stats
+
+
+def merge_role_stats(total: dict, stats: dict) -> dict:
+    """Add the role_stats of one debate (or an earlier total) to a run total (in place)"""
+    for role, entry in stats.items():
+        if role in total and total[role]["model"] != entry["model"]:
+            # same role on another model (e.g. a run over several debate models): keep it apart
+            role = f"{role.split('@')[0]}@{entry['model']}"
+        acc = total.setdefault(role, {"model": entry["model"], "debates": 0, "calls": 0, "prompt_tokens": 0,
+                                      "completion_tokens": 0, "seconds": 0.0, "cost": 0.0})
+        acc["debates"] += entry.get("debates", 1)
+        for key in ("calls", "prompt_tokens", "completion_tokens", "seconds"):
+            acc[key] += entry[key]
+        acc["cost"] = None if acc["cost"] is None or entry["cost"] is None else acc["cost"] + entry["cost"]
+    return total
+
+
+def format_role_stats(total: dict) -> str:
+    def order(role):
+        base = role.split("@")[0]
+        return (ROLES.index(base) if base in ROLES else len(ROLES), role)
+
+    lines = [f"{'role':<30}{'model':<20}{'debates':>8}{'calls':>7}{'s/call':>8}{'API s':>9}{'tokens':>10}{'USD':>10}"]
+    for role in sorted(total, key=order):
+        e = total[role]
+        per_call = e["seconds"] / e["calls"] if e["calls"] else 0.0
+        cost = "n/a" if e["cost"] is None else f"{e['cost']:.4f}"
+        lines.append(f"{role:<30}{e['model']:<20}{e.get('debates', 1):>8}{e['calls']:>7}{per_call:>8.2f}"
+                     f"{e['seconds']:>9.1f}{e['prompt_tokens'] + e['completion_tokens']:>10}{cost:>10}")
+    known = [e["cost"] for e in total.values() if e["cost"] is not None]
+    lines.append(f"total API time {sum(e['seconds'] for e in total.values()):.1f}s, "
+                 f"cost {sum(known):.4f} USD" + ("" if len(known) == len(total) else " (some models unpriced)"))
+    return "\n".join(lines)
@@ -1,5 +1,18 @@
-import tiktoken
+import functools
+import hashlib
+import os
 
+# tiktoken is imported lazily in _get_encoding: importing it (and downloading the BPE file on
+# first use) is the slowest part of starting a debate run.
+TOKENIZER_DIR_ENV = "MAD_TOKENIZER_DIR"
+OFFLINE_ENV = "MAD_OFFLINE"
+DEFAULT_TOKENIZER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tokenizer_assets")
+
+# BPE files tiktoken downloads for the encodings we use; cached under sha1(url) in TIKTOKEN_CACHE_DIR
+encoding2url = {
+    "cl100k_base": "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken",
+    "o200k_base": "https://openaipublic.blob.core.windows.net/encodings/o200k_base.tiktoken",
+}
 
 model2max_context = {
     "gpt-4": 7900,
@@ -10,6 +23,17 @@ model2max_context = {
     "text-davinci-002": 4096,
 }
 
+# USD per 1M (prompt, completion) tokens, used for the per-role cost report; a prompt config can
+# override or extend it with "model_prices": {"model": [prompt, completion]}
+model2price = {
+    "deepseek-chat": (0.27, 1.10),
+    "deepseek-reasoner": (0.55, 2.19),
+    "gpt-4": (30.0, 60.0),
+    "gpt-4-0314": (30.0, 60.0),
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "gpt-3.5-turbo-0301": (1.5, 2.0),
+}
+
 class OutOfQuotaException(Exception):
     "Raised when the key exceeded the current quota"
     def __init__(self, key, cause=None):
@@ -36,9 +60,85 @@ class AccessTerminatedException(Exception):
         else:
             return super().__str__()
 
+def tokenizer_dir() -> str:
+    return os.environ.get(TOKENIZER_DIR_ENV, DEFAULT_TOKENIZER_DIR)
+
+
+def is_offline() -> bool:
+    return os.environ.get(OFFLINE_ENV, "") not in ("", "0")
+
+
+def _is_cached(encoding_name: str) -> bool:
+    url = encoding2url.get(encoding_name)
+    if url is None:
+        return False
+    return os.path.exists(os.path.join(tokenizer_dir(), hashlib.sha1(url.encode()).hexdigest()))
+
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding(model_name: str):
+    """Load the tiktoken encoding for a model, preferring the local asset dir.
+
+    Returns None when the BPE file is unavailable (air-gapped worker without a
+    pre-cached asset dir); callers then fall back to an estimate.
+    """
+    # tiktoken reads TIKTOKEN_CACHE_DIR at load time, so pointing it at the asset dir
+    # makes a pre-fetched copy (see ``python utils/openai_utils.py --prefetch``) win over the network
+    if os.path.isdir(tokenizer_dir()):
+        os.environ.setdefault("TIKTOKEN_CACHE_DIR", tokenizer_dir())
+    import tiktoken
+
+    try:
+        encoding_name = tiktoken.encoding_name_for_model(model_name)
+    except KeyError:
+        encoding_name = "cl100k_base"
+    if is_offline() and not _is_cached(encoding_name):
+        print(f"Warning: {encoding_name} is not in {tokenizer_dir()} and {OFFLINE_ENV} is set; "
+              f"estimating token counts instead.")
+        return None
+    try:
+        return tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        print(f"Warning: cannot load tokenizer {encoding_name} ({e}); estimating token counts instead.")
+        return None
+
+
 def num_tokens_from_string(string: str, model_name: str) -> int:
     """Returns the number of tokens in a text string."""
-    encoding = tiktoken.encoding_for_model(model_name)
+    encoding = _get_encoding(model_name)
+    if encoding is None:
+        # conservative estimate: ~1 token per CJK character, ~3 bytes per token otherwise
+        return len(string.encode("utf-8")) // 3 + 1
     num_tokens = len(encoding.encode(string))
     return num_tokens
 
+
+def prefetch_tokenizers(target_dir: str = None, encodings: "list[str]" = None) -> str:
+    """Download BPE files into the tokenizer asset dir so later runs work offline"""
+    target_dir = target_dir or tokenizer_dir()
+    os.makedirs(target_dir, exist_ok=True)
+    os.environ["TIKTOKEN_CACHE_DIR"] = target_dir
+    import tiktoken
+
+    for name in encodings or list(encoding2url):
+        tiktoken.get_encoding(name)
+        print(f"Cached {name} in {target_dir}")
+    return target_dir
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser("Tokenizer asset helper")
+    parser.add_argument("--prefetch", action="store_true", help="Download tokenizer BPE files for offline use")
+    parser.add_argument("--dir", type=str, default=None, help=f"Asset dir (default: ${TOKENIZER_DIR_ENV} or "
+                                                              f"{DEFAULT_TOKENIZER_DIR})")
+    args = parser.parse_args()
+    if args.dir:
+        os.environ[TOKENIZER_DIR_ENV] = args.dir
+    if args.prefetch:
+        prefetch_tokenizers()
+    else:
+        for name in encoding2url:
+            print(f"{name}: {'cached' if _is_cached(name) else 'missing'} in {tokenizer_dir()}")
+
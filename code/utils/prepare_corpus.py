@@ -0,0 +1,265 @@
+"""
+Streaming preparation of parallel corpora for debate4tran.py / debate_queue.py.
+
+Reads a source and a target file (plain or .gz) line by line, checks that they stay
+aligned, normalizes and optionally deduplicates the pairs and writes them as
+``source<TAB>reference`` TSV (the debate4tran input format) or JSONL, optionally
+gzipped and split into shards.  A ``{prefix}.manifest.json`` next to the output
+records the options, the sha256 and line count of every input and shard, and how many
+pairs were dropped and why.
+
+Memory does not grow with the corpus, except for deduplication, which keeps an 8 byte
+hash per distinct pair (``--no-dedupe`` turns it off).
+
+    python code/utils/prepare_corpus.py --src corpus.zh.gz --tgt corpus.en.gz -o data/corpus \\
+        --shard-size 100000 --format tsv
+"""
+
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import time
+import unicodedata
+from itertools import zip_longest
+
+_SPACE_RE = re.compile(r"\s+")
+# C0/C1 control characters except tab/newline (which are collapsed as whitespace anyway)
+_CONTROL_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f]")
+
+
+class _HashingReader(io.RawIOBase):
+    """Raw reader that hashes the bytes of the underlying file as they are read"""
+
+    def __init__(self, f) -> None:
+        self.f = f
+        self.sha256 = hashlib.sha256()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = self.f.readinto(b)
+        if n:
+            self.sha256.update(memoryview(b)[:n])
+        return n
+
+    def close(self):
+        self.f.close()
+        super().close()
+
+
+def open_input(path: str) -> "tuple[io.TextIOWrapper, _HashingReader]":
+    raw = _HashingReader(open(path, "rb"))
+    stream = io.BufferedReader(raw, buffer_size=1 << 20)
+    if path.endswith(".gz"):
+        stream = gzip.GzipFile(fileobj=stream, mode="rb")
+    return io.TextIOWrapper(stream, encoding="utf-8-sig", errors="strict"), raw
+
+
+def normalize(text: str, form: str = "NFC", clean: bool = True) -> str:
+    """Unicode normalization (NFC / NFKC / none), control characters removed, whitespace
+    (including tabs, which would break the TSV format) collapsed to single spaces;
+    with ``clean`` off only the leading/trailing whitespace is stripped"""
+    if form:
+        text = unicodedata.normalize(form, text)
+    if not clean:
+        return text.strip()
+    text = _CONTROL_RE.sub("", text)
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+class _ShardWriter:
+    def __init__(self, out_dir: str, prefix: str, fmt: str, compress: bool, shard_size: int,
+                 name: str = None) -> None:
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.name = name
+        self.fmt = fmt
+        self.compress = compress
+        self.shard_size = shard_size
+        self.shards = []
+        self._f = None
+
+    def _name(self) -> str:
+        ext = "." + self.fmt + (".gz" if self.compress else "")
+        if not self.shard_size:
+            return self.name or self.prefix + ext
+        return f"{self.prefix}-{len(self.shards):05d}{ext}"
+
+    def _open(self):
+        name = self._name()
+        path = os.path.join(self.out_dir, name)
+        raw = open(path + ".tmp", "wb")
+        stream = gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) if self.compress else raw
+        self._f = {"name": name, "path": path, "raw": raw, "stream": stream, "lines": 0,
+                   "sha256": hashlib.sha256(), "buffer": []}
+
+    def write(self, id: int, src: str, tgt: str):
+        if self._f is None:
+            self._open()
+        if self.fmt == "jsonl":
+            line = json.dumps({"id": id, "source": src, "reference": tgt}, ensure_ascii=False) + "\n"
+        else:
+            line = f"{src}\t{tgt}\n"
+        data = line.encode("utf-8")
+        self._f["sha256"].update(data)
+        self._f["buffer"].append(data)
+        self._f["lines"] += 1
+        if len(self._f["buffer"]) >= 4096:
+            self._flush()
+        if self.shard_size and self._f["lines"] >= self.shard_size:
+            self._close()
+
+    def _flush(self):
+        self._f["stream"].write(b"".join(self._f["buffer"]))
+        self._f["buffer"] = []
+
+    def _close(self):
+        self._flush()
+        if self._f["stream"] is not self._f["raw"]:
+            self._f["stream"].close()
+        self._f["raw"].close()
+        os.replace(self._f["path"] + ".tmp", self._f["path"])
+        self.shards.append({"path": self._f["name"], "lines": self._f["lines"],
+                            "sha256": self._f["sha256"].hexdigest(), "bytes": os.path.getsize(self._f["path"])})
+        self._f = None
+
+    def abort(self):
+        if self._f is not None:
+            self._f["raw"].close()
+            os.remove(self._f["path"] + ".tmp")
+            self._f = None
+
+    def close(self) -> list:
+        if self._f is not None:
+            self._close()
+        elif not self.shards:
+            # an empty corpus still gets its (empty) output file
+            self._open()
+            self._close()
+        return self.shards
+
+
+def _pairs(src, tgt, src_path: str, tgt_path: str):
+    """Aligned line pairs; fails at the first line where one side has run out"""
+    for lineno, (s, t) in enumerate(zip_longest(src, tgt), 1):
+        if s is None or t is None:
+            short, long_ = (src_path, tgt_path) if s is None else (tgt_path, src_path)
+            raise ValueError(f"Line count mismatch: {short} ends at line {lineno - 1}, "
+                             f"{long_} continues at line {lineno}")
+        yield s, t
+
+
+def prepare(src_path: str, tgt_path: str, out_dir: str, prefix: str = "part", fmt: str = "tsv",
+            compress: bool = False, shard_size: int = 0, unicode_form: str = "NFC", dedupe: bool = True,
+            keep_empty: bool = False, max_chars: int = None, clean: bool = True, name: str = None) -> dict:
+    """Prepare a parallel corpus; see the module docstring
+
+    Args:
+        src_path (str): source side, one sentence per line (.gz allowed)
+        tgt_path (str): target side, aligned with src_path
+        out_dir (str): output dir (created if missing)
+        prefix (str): output file prefix
+        fmt (str): "tsv" (source<TAB>reference) or "jsonl"
+        compress (bool): gzip the output
+        shard_size (int): pairs per shard, 0 for a single output file
+        unicode_form (str): "NFC", "NFKC" or None
+        dedupe (bool): drop pairs seen before (after normalization)
+        keep_empty (bool): keep pairs with an empty side (keeps the output aligned with the input)
+        max_chars (int): drop pairs with a side longer than this
+        clean (bool): remove control characters and collapse whitespace; off only strips the ends
+            (a tab inside a line then ends up in the TSV as is)
+        name (str): output file name instead of prefix + extension (single file only)
+
+    Returns:
+        dict: the manifest
+    """
+    if fmt not in ("tsv", "jsonl"):
+        raise ValueError(f"Unknown output format {fmt!r}")
+    if name and shard_size:
+        raise ValueError("An output file name needs shard_size=0")
+    os.makedirs(out_dir, exist_ok=True)
+    start = time.time()
+    stats = {"read": 0, "written": 0, "empty": 0, "duplicate": 0, "too_long": 0}
+    seen = set()
+    writer = _ShardWriter(out_dir, prefix, fmt, compress, shard_size, name)
+
+    src, src_raw = open_input(src_path)
+    tgt, tgt_raw = open_input(tgt_path)
+    with src, tgt:
+        try:
+            for s, t in _pairs(src, tgt, src_path, tgt_path):
+                stats["read"] += 1
+                s, t = normalize(s, unicode_form, clean), normalize(t, unicode_form, clean)
+                if not keep_empty and (not s or not t):
+                    stats["empty"] += 1
+                    continue
+                if max_chars and (len(s) > max_chars or len(t) > max_chars):
+                    stats["too_long"] += 1
+                    continue
+                if dedupe:
+                    key = hashlib.blake2b(f"{s}\t{t}".encode("utf-8"), digest_size=8).digest()
+                    if key in seen:
+                        stats["duplicate"] += 1
+                        continue
+                    seen.add(key)
+                writer.write(stats["written"], s, t)
+                stats["written"] += 1
+        except BaseException:
+            writer.abort()
+            raise
+    shards = writer.close()
+
+    manifest = {
+        "created": time.strftime("%Y-%m-%d_%H:%M:%S"),
+        "options": {"format": fmt, "gzip": compress, "shard_size": shard_size, "unicode": unicode_form,
+                    "clean": clean, "dedupe": dedupe, "keep_empty": keep_empty, "max_chars": max_chars},
+        "inputs": {
+            "source": {"path": os.path.abspath(src_path), "lines": stats["read"],
+                       "sha256": src_raw.sha256.hexdigest()},
+            "reference": {"path": os.path.abspath(tgt_path), "lines": stats["read"],
+                          "sha256": tgt_raw.sha256.hexdigest()},
+        },
+        "shards": shards,
+        "stats": stats,
+        "seconds": round(time.time() - start, 3),
+    }
+    with open(os.path.join(out_dir, f"{prefix}.manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+    return manifest
+
+
+def parse_args():
+    parser = argparse.ArgumentParser("", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--src", type=str, required=True, help="Source side (one sentence per line, .gz allowed)")
+    parser.add_argument("--tgt", type=str, required=True, help="Target side, aligned with --src")
+    parser.add_argument("-o", "--output-dir", type=str, required=True, help="Output dir")
+    parser.add_argument("--prefix", type=str, default="part", help="Output file prefix")
+    parser.add_argument("--format", type=str, default="tsv", choices=["tsv", "jsonl"], help="Output format")
+    parser.add_argument("--gzip", action="store_true", help="Gzip the output")
+    parser.add_argument("--shard-size", type=int, default=0, help="Pairs per shard (0 = single file)")
+    parser.add_argument("--unicode", type=str, default="NFC", choices=["NFC", "NFKC", "none"],
+                        help="Unicode normalization (NFKC also folds full-width punctuation)")
+    parser.add_argument("--no-clean", action="store_true",
+                        help="Keep control characters and inner whitespace (only strip the ends of each line)")
+    parser.add_argument("--no-dedupe", action="store_true", help="Keep duplicate pairs")
+    parser.add_argument("--keep-empty", action="store_true", help="Keep pairs with an empty side")
+    parser.add_argument("--max-chars", type=int, default=None, help="Drop pairs with a longer side")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    manifest = prepare(args.src, args.tgt, args.output_dir, prefix=args.prefix, fmt=args.format,
+                       compress=args.gzip, shard_size=args.shard_size,
+                       unicode_form=None if args.unicode == "none" else args.unicode, clean=not args.no_clean,
+                       dedupe=not args.no_dedupe, keep_empty=args.keep_empty, max_chars=args.max_chars)
+    st = manifest["stats"]
+    print(f"Read {st['read']} pairs, wrote {st['written']} in {len(manifest['shards'])} file(s) "
+          f"(dropped: {st['empty']} empty, {st['duplicate']} duplicate, {st['too_long']} too long) "
+          f"in {manifest['seconds']:.1f}s")
+    print(f"Manifest: {os.path.join(args.output_dir, args.prefix + '.manifest.json')}")
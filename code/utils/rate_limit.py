@@ -0,0 +1,58 @@
+import threading
+import time
+
+from . import tracing
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute: float, burst: int = None) -> None:
+        """Token bucket shared by all threads of a process
+
+        Args:
+            requests_per_minute (float): sustained request rate
+            burst (int): requests that may go out back to back after an idle period,
+                default one second's worth (at least 1)
+        """
+        self.rate = requests_per_minute / 60.0
+        self.burst = burst if burst is not None else max(1, int(self.rate))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited = 0.0
+        self.requests = 0
+
+    def _reserve(self) -> float:
+        """Take a token; returns how long the caller has to wait before it may use it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            self.requests += 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.waited += wait
+            return wait
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            with tracing.span("rate_limit", seconds=round(wait, 3)):
+                time.sleep(wait)
+
+    def summary(self) -> dict:
+        return {"requests_per_minute": self.rate * 60, "requests": self.requests, "waited_seconds": round(self.waited, 3)}
+
+
+_limiter = None
+
+
+def configure(requests_per_minute: float = None, burst: int = None) -> "RateLimiter | None":
+    """Set the process-wide limiter used by Agent.query (None / 0 turns it off)"""
+    global _limiter
+    _limiter = RateLimiter(requests_per_minute, burst) if requests_per_minute else None
+    return _limiter
+
+
+def acquire():
+    if _limiter is not None:
+        _limiter.acquire()
@@ -0,0 +1,97 @@
+import json
+import math
+import os
+import threading
+from collections import deque
+
+# roles used as keys of "max_tokens" in the prompt configs
+ROLES = ["baseline", "affirmative", "negative", "moderator", "judge"]
+
+
+class TokenBudget:
+    def __init__(self, budgets: dict = None, learn: bool = False, percentile: float = 0.95, margin: float = 1.25,
+                 min_samples: int = 20, floor: int = 64, window: int = 500, state_path: str = None) -> None:
+        """Per-role max_tokens budgets, optionally learned from observed completion lengths
+
+        A role without a configured budget and without enough samples keeps the old behaviour
+        (context limit minus prompt tokens).  Once ``min_samples`` completions of a role have been
+        observed and learning is on, the learned limit (``percentile`` of the last ``window``
+        completions times ``margin``) replaces the configured one.
+
+        Args:
+            budgets (dict): role -> max_tokens, e.g. {"moderator": 400}; players on another model than the
+                debate's (routed or escalated) use "role@model" keys, e.g. "moderator@deepseek-reasoner"
+            learn (bool): learn the budgets online
+            percentile (float): percentile of observed completion lengths
+            margin (float): head room multiplied onto the percentile
+            min_samples (int): observations needed before the learned budget is used
+            floor (int): smallest budget ever returned
+            window (int): number of recent completions kept per role
+            state_path (str): json file the observations are loaded from / saved to
+        """
+        self.budgets = {role: int(n) for role, n in (budgets or {}).items() if n}
+        self.learn = learn
+        self.percentile = percentile
+        self.margin = margin
+        self.min_samples = min_samples
+        self.floor = floor
+        self.window = window
+        self.state_path = state_path
+        self._history = {}
+        self._lock = threading.Lock()
+        if state_path and os.path.exists(state_path):
+            with open(state_path, "r", encoding="utf-8") as f:
+                for role, lengths in json.load(f).items():
+                    self._history[role] = deque(lengths, maxlen=window)
+
+    @classmethod
+    def from_config(cls, config: dict, state_path: str = None) -> "TokenBudget":
+        """Build from the "max_tokens" / "max_tokens_learning" entries of a prompt config
+
+        The shipped configs list per-role budgets with "enabled": false, so no call is capped;
+        set it to true to apply them as hard limits, or enable "max_tokens_learning" to cap
+        with limits learned from the observed completion lengths instead.
+        """
+        budgets = dict(config.get("max_tokens") or {})
+        if not budgets.pop("enabled", True):
+            budgets = {}
+        learning = dict(config.get("max_tokens_learning") or {})
+        learn = learning.pop("enabled", False)
+        return cls(budgets, learn=learn, state_path=state_path, **learning)
+
+    def learned(self, role: str) -> "int | None":
+        with self._lock:
+            history = sorted(self._history.get(role, ()))
+        if len(history) < self.min_samples:
+            return None
+        value = history[max(0, math.ceil(self.percentile * len(history)) - 1)]
+        return max(self.floor, math.ceil(value * self.margin))
+
+    def limit(self, role: str) -> "int | None":
+        """max_tokens for the next call of this role, None for no budget"""
+        if role is None:
+            return None
+        if self.learn:
+            learned = self.learned(role)
+            if learned is not None:
+                return learned
+        return self.budgets.get(role)
+
+    def observe(self, role: str, completion_tokens: int):
+        if role is None or completion_tokens is None:
+            return
+        with self._lock:
+            self._history.setdefault(role, deque(maxlen=self.window)).append(int(completion_tokens))
+
+    def save(self):
+        if not self.state_path:
+            return
+        with self._lock:
+            state = {role: list(lengths) for role, lengths in self._history.items()}
+        with open(self.state_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+
+    def summary(self) -> dict:
+        return {role: {"configured": self.budgets.get(role), "learned": self.learned(role),
+                       "samples": len(self._history.get(role, ()))}
+                for role in sorted(set(self.budgets) | set(self._history))}
@@ -0,0 +1,239 @@
+"""
+Lightweight span tracing for debate runs.
+
+Spans are written to a local file in Chrome trace-event format (JSON array
+form), which can be opened directly in chrome://tracing or https://ui.perfetto.dev
+as a flame chart.  The array form does not need a closing bracket, so events are
+appended in small batches and a crashed run still leaves a readable trace.
+
+Typical nesting: run -> item -> debate -> round -> role -> api_attempt.
+
+When no trace file is configured every call returns a shared no-op context
+manager, so the instrumentation can stay in the hot path.  ``sample_rate``
+decides once per sampled root span (one per input item) whether its whole
+subtree is recorded.  The decision lives in a context variable; work handed to a
+thread pool is wrapped with ``bind`` so it keeps the decision of the item that
+submitted it, and its spans are linked to the submitting span by a flow arrow.
+"""
+
+import atexit
+import contextvars
+import itertools
+import json
+import os
+import random
+import threading
+import time
+
+TRACE_FILE_ENV = "MAD_TRACE_FILE"
+TRACE_SAMPLE_RATE_ENV = "MAD_TRACE_SAMPLE_RATE"
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+# False inside the subtree of a sampling root that was not sampled
+_sampled = contextvars.ContextVar("mad_trace_sampled", default=True)
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "cat", "args", "sample", "start", "prev_sampled")
+
+    def __init__(self, tracer, name: str, cat: str, args: dict, sample: bool):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.sample = sample
+
+    def __enter__(self):
+        self.prev_sampled = _sampled.get()
+        if self.sample:
+            _sampled.set(self.prev_sampled and random.random() < self.tracer.sample_rate)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        if _sampled.get():
+            if exc_type is not None:
+                self.args["error"] = exc_type.__name__
+            self.tracer._emit({
+                "name": self.name,
+                "cat": self.cat,
+                "ph": "X",
+                "ts": (self.start - self.tracer._t0) / 1000,
+                "dur": (end - self.start) / 1000,
+                "pid": self.tracer.pid,
+                "tid": threading.get_native_id(),
+                "args": self.args,
+            })
+        _sampled.set(self.prev_sampled)
+        return False
+
+    def set(self, **args):
+        """Attach extra arguments to the span, e.g. results known only at the end"""
+        self.args.update(args)
+
+
+class Tracer:
+    def __init__(self, path: str = None, sample_rate: float = 1.0, flush_every: int = 1000) -> None:
+        """Create a tracer
+
+        Args:
+            path (str): trace file path, tracing is disabled when None
+            sample_rate (float): fraction of sampled root spans (items) that are recorded
+            flush_every (int): number of buffered events before appending to the file
+        """
+        self.path = path
+        self.sample_rate = sample_rate
+        self.flush_every = flush_every
+        self.pid = os.getpid()
+        self._t0 = time.perf_counter_ns()
+        self._flow_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._named_threads = set()
+        if path is not None:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("[\n")
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def span(self, name: str, cat: str = "mad", sample: bool = False, **args):
+        """Open a span; use as a context manager
+
+        Args:
+            name (str): span name shown in the flame chart
+            cat (str): trace-event category
+            sample (bool): make this span a sampling root for its subtree
+            **args: arguments attached to the span
+        """
+        if self.path is None or not _sampled.get():
+            return _NOOP
+        return _Span(self, name, cat, args, sample)
+
+    def instant(self, name: str, cat: str = "mad", **args):
+        """Record a zero-duration event (e.g. a backoff decision)"""
+        if self.path is None or not _sampled.get():
+            return
+        self._emit({
+            "name": name,
+            "cat": cat,
+            "ph": "i",
+            "s": "t",
+            "ts": (time.perf_counter_ns() - self._t0) / 1000,
+            "pid": self.pid,
+            "tid": threading.get_native_id(),
+            "args": args,
+        })
+
+    def bind(self, fn):
+        """Wrap ``fn`` to run on another thread (e.g. a pool worker) as part of the current item:
+        it keeps the caller's sampling decision, and a flow arrow links its spans to the caller's span"""
+        ctx = contextvars.copy_context()
+        flow = None
+        if self.path is not None and _sampled.get():
+            flow = next(self._flow_ids)
+            self._flow("s", flow)
+
+        def run(*args, **kwargs):
+            # a copy per call, so the wrapper may also run several times at once
+            return ctx.copy().run(self._run_bound, flow, fn, args, kwargs)
+
+        return run
+
+    def _run_bound(self, flow, fn, args, kwargs):
+        if flow is not None:
+            # binds to the next span that starts on this thread
+            self._flow("f", flow)
+        return fn(*args, **kwargs)
+
+    def _flow(self, ph: str, flow: int):
+        self._emit({
+            "name": "submit",
+            "cat": "flow",
+            "ph": ph,
+            "id": flow,
+            "ts": (time.perf_counter_ns() - self._t0) / 1000,
+            "pid": self.pid,
+            "tid": threading.get_native_id(),
+        })
+
+    def _emit(self, event: dict):
+        tid = event["tid"]
+        with self._lock:
+            if tid not in self._named_threads:
+                self._named_threads.add(tid)
+                self._buffer.append({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid,
+                                     "args": {"name": threading.current_thread().name}})
+            self._buffer.append(event)
+            if len(self._buffer) >= self.flush_every:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        lines = "".join(json.dumps(e, ensure_ascii=False) + ",\n" for e in self._buffer)
+        self._buffer = []
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    def flush(self):
+        if self.path is None:
+            return
+        with self._lock:
+            self._flush_locked()
+
+
+_tracer = Tracer()
+
+
+def configure(path: str = None, sample_rate: float = 1.0) -> Tracer:
+    """Install the process-wide tracer; pass path=None to disable tracing"""
+    global _tracer
+    _tracer.flush()
+    if not 0.0 <= sample_rate <= 1.0:
+        raise ValueError(f"sample_rate must be within [0, 1], got {sample_rate}")
+    _tracer = Tracer(path, sample_rate)
+    return _tracer
+
+
+def configure_from_env() -> Tracer:
+    """Configure tracing from MAD_TRACE_FILE / MAD_TRACE_SAMPLE_RATE"""
+    return configure(os.environ.get(TRACE_FILE_ENV) or None, float(os.environ.get(TRACE_SAMPLE_RATE_ENV, 1.0)))
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def span(name: str, cat: str = "mad", sample: bool = False, **args):
+    return _tracer.span(name, cat, sample, **args)
+
+
+def instant(name: str, cat: str = "mad", **args):
+    _tracer.instant(name, cat, **args)
+
+
+def bind(fn):
+    return _tracer.bind(fn)
+
+
+def flush():
+    _tracer.flush()
+
+
+atexit.register(flush)
@@ -0,0 +1,320 @@
+"""
+Compact, deduplicated storage for debate transcripts (``.madpack``).
+
+A debate output dir repeats the same text many times: meta prompts are copied into
+every player's ``memory_lst`` and each answer is quoted again in the opponent's
+``debate_prompt`` and in the ``moderator_prompt``.  A pack stores every distinct
+string once and replaces strings by ids:
+
+* top-level string fields (``source``, ``debate_translation``, ...) are interned whole;
+* nested strings (player messages) are split into ``\\n\\n`` paragraphs and interned
+  per paragraph, which catches answers quoted inside longer prompts;
+* the string table is written in zlib-compressed blocks, top-level fields first so
+  that reading one field for all items only inflates a few blocks;
+* fixed-width offset tables (uint32/uint64, little-endian) are read straight from an
+  mmap, so ``field("debate_translation")`` never parses the transcripts.
+
+Layout: ``MAGIC | blocks | block index | string index | columns | records |
+record index | header json | header offset (u64) | header length (u64) | MAGIC``.
+
+    python code/utils/transcript_store.py pack data/CommonMT/output data/CommonMT/output.madpack
+    python code/utils/transcript_store.py field data/CommonMT/output.madpack debate_translation
+"""
+
+import argparse
+import functools
+import glob
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+MAGIC = b"MADPACK1"
+MISSING = 0xFFFFFFFF
+PARAGRAPH_SEP = "\n\n"
+# single-key dicts with these keys are markers; a real dict that looks like one is wrapped in "#d"
+SENTINELS = ("#p", "#n", "#d")
+
+
+def _key_order(key: str):
+    # 0, 1, 2, ..., 10 before "0-config", ...
+    return (0, int(key), "") if key.isdigit() else (1, 0, key)
+
+
+def _le(arr: array) -> bytes:
+    if sys.byteorder != "little":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+class _StringTable:
+    def __init__(self, block_size: int) -> None:
+        self.block_size = block_size
+        self.ids = {}
+        self.index = array("I")  # (block, start, end) per string
+        self.blocks = []
+        self.block_offsets = array("Q", [0])
+        self._buf = bytearray()
+
+    def intern(self, s: str) -> int:
+        sid = self.ids.get(s)
+        if sid is None:
+            data = s.encode("utf-8")
+            if self._buf and len(self._buf) + len(data) > self.block_size:
+                self._close_block()
+            sid = self.ids[s] = len(self.ids)
+            self.index.extend((len(self.blocks), len(self._buf), len(self._buf) + len(data)))
+            self._buf += data
+        return sid
+
+    def _close_block(self):
+        block = zlib.compress(bytes(self._buf), 6)
+        self.blocks.append(block)
+        self.block_offsets.append(self.block_offsets[-1] + len(block))
+        self._buf = bytearray()
+
+    def finish(self):
+        if self._buf:
+            self._close_block()
+
+
+def _encode(value, strings: _StringTable, top: bool = False):
+    """Replace strings by ids: int = string id, {"#p": [...]} = paragraphs, {"#n": x} = number,
+    {"#d": {...}} = a dict whose only key is one of the markers"""
+    if isinstance(value, str):
+        if not top and PARAGRAPH_SEP in value:
+            return {"#p": [strings.intern(p) for p in value.split(PARAGRAPH_SEP)]}
+        return strings.intern(value)
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return {"#n": value}
+    if isinstance(value, list):
+        return [_encode(v, strings) for v in value]
+    if isinstance(value, dict):
+        encoded = {k: _encode(v, strings) for k, v in value.items()}
+        if len(value) == 1 and next(iter(value)) in SENTINELS:
+            return {"#d": encoded}
+        return encoded
+    raise TypeError(f"Cannot store {type(value).__name__} in a transcript pack")
+
+
+def pack(items: "dict[str, str]", out_path: str, block_size: int = 1 << 16, loader=None) -> dict:
+    """Write transcripts to a pack file
+
+    Args:
+        items (dict[str, str]): item key -> json file path
+        out_path (str): pack file to write
+        block_size (int): uncompressed size of a string block
+        loader: json file loader, defaults to utf-8 json.load
+
+    Returns:
+        dict: size statistics
+    """
+    loader = loader or (lambda p: json.load(open(p, "r", encoding="utf-8")))
+    keys = sorted(items, key=_key_order)
+    strings = _StringTable(block_size)
+
+    # pass 1: top-level string fields, interned first so each field lives in a few blocks
+    fields = []
+    columns = {}
+    objs = [loader(items[key]) for key in keys]
+    for i, obj in enumerate(objs):
+        for field, value in obj.items():
+            if not isinstance(value, str):
+                continue
+            if field not in columns:
+                fields.append(field)
+                columns[field] = array("I", [MISSING]) * len(keys)
+            columns[field][i] = strings.intern(value)
+
+    # pass 2: full records (nested strings as paragraph ids)
+    records = []
+    record_offsets = array("Q", [0])
+    for obj in objs:
+        rec = json.dumps({k: _encode(v, strings, top=True) for k, v in obj.items()}, separators=(",", ":"))
+        records.append(zlib.compress(rec.encode("utf-8"), 6))
+        record_offsets.append(record_offsets[-1] + len(records[-1]))
+    strings.finish()
+
+    sections = [
+        ("blocks", b"".join(strings.blocks)),
+        ("block_index", _le(strings.block_offsets)),
+        ("string_index", _le(strings.index)),
+        ("columns", b"".join(_le(columns[f]) for f in fields)),
+        ("records", b"".join(records)),
+        ("record_index", _le(record_offsets)),
+    ]
+    header = {"version": 1, "keys": keys, "fields": fields, "n_strings": len(strings.ids),
+              "n_blocks": len(strings.blocks), "sections": {}}
+    with open(out_path, "wb") as f:
+        f.write(MAGIC)
+        for name, data in sections:
+            f.write(b"\0" * (-f.tell() % 8))  # keep offset tables aligned for memoryview.cast
+            header["sections"][name] = [f.tell(), len(data)]
+            f.write(data)
+        header_offset = f.tell()
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        f.write(header_bytes)
+        f.write(struct.pack("<QQ", header_offset, len(header_bytes)))
+        f.write(MAGIC)
+        size = f.tell()
+    return {"items": len(keys), "strings": len(strings.ids), "blocks": len(strings.blocks), "bytes": size}
+
+
+def pack_dir(input_dir: str, out_path: str, block_size: int = 1 << 16, loader=None) -> dict:
+    """Pack every *.json in a debate output dir (``0.json``, ``0-config.json``, ...)"""
+    files = glob.glob(os.path.join(input_dir, "*.json"))
+    if not files:
+        raise RuntimeError(f"No json files found in {input_dir}")
+    items = {os.path.splitext(os.path.basename(p))[0]: p for p in files}
+    return pack(items, out_path, block_size, loader)
+
+
+class TranscriptStore:
+    def __init__(self, path: str) -> None:
+        """Open a pack file read-only (memory mapped)
+
+        Args:
+            path (str): pack file written by pack()/pack_dir()
+        """
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:8] != MAGIC or self._mm[-8:] != MAGIC:
+            raise ValueError(f"{path} is not a transcript pack")
+        header_offset, header_len = struct.unpack_from("<QQ", self._mm, len(self._mm) - 24)
+        self.header = json.loads(self._mm[header_offset:header_offset + header_len].decode("utf-8"))
+        self.keys = self.header["keys"]
+        self.fields = self.header["fields"]
+        self._key_pos = {k: i for i, k in enumerate(self.keys)}
+        self._block_index = self._table("block_index", "Q")
+        self._string_index = self._table("string_index", "I")
+        self._columns = self._table("columns", "I")
+        self._record_index = self._table("record_index", "Q")
+        self._get_block = functools.lru_cache(maxsize=64)(self._inflate_block)
+
+    def _section(self, name: str) -> memoryview:
+        offset, length = self.header["sections"][name]
+        return memoryview(self._mm)[offset:offset + length]
+
+    def _table(self, name: str, typecode: str):
+        view = self._section(name)
+        if sys.byteorder == "little":
+            return view.cast(typecode)
+        arr = array(typecode, view.tobytes())
+        arr.byteswap()
+        return arr
+
+    def _inflate_block(self, block: int) -> bytes:
+        start = self.header["sections"]["blocks"][0]
+        return zlib.decompress(self._mm[start + self._block_index[block]:start + self._block_index[block + 1]])
+
+    def string(self, sid: int) -> str:
+        block, start, end = self._string_index[3 * sid:3 * sid + 3]
+        return self._get_block(block)[start:end].decode("utf-8")
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def field(self, name: str) -> list:
+        """Value of one top-level field for every item (in key order), None where missing"""
+        if name not in self.fields:
+            return [self.get(k).get(name) for k in self.keys]
+        n = len(self.keys)
+        column = self._columns[self.fields.index(name) * n:(self.fields.index(name) + 1) * n]
+        return [None if sid == MISSING else self.string(sid) for sid in column]
+
+    def _decode(self, value):
+        if isinstance(value, bool) or value is None:
+            return value
+        if isinstance(value, int):
+            return self.string(value)
+        if isinstance(value, list):
+            return [self._decode(v) for v in value]
+        if "#p" in value and len(value) == 1:
+            return PARAGRAPH_SEP.join(self.string(sid) for sid in value["#p"])
+        if "#n" in value and len(value) == 1:
+            return value["#n"]
+        if "#d" in value and len(value) == 1:
+            return {k: self._decode(v) for k, v in value["#d"].items()}
+        return {k: self._decode(v) for k, v in value.items()}
+
+    def get(self, key) -> dict:
+        """Full transcript of one item, as it was in the original json file"""
+        i = self._key_pos[str(key)]
+        start = self.header["sections"]["records"][0]
+        rec = zlib.decompress(self._mm[start + self._record_index[i]:start + self._record_index[i + 1]])
+        return {k: self._decode(v) for k, v in json.loads(rec).items()}
+
+    def items(self):
+        for key in self.keys:
+            yield key, self.get(key)
+
+    def close(self):
+        for table in (self._block_index, self._string_index, self._columns, self._record_index):
+            if isinstance(table, memoryview):
+                table.release()
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser("Transcript pack tool")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("pack", help="Pack a debate output dir")
+    p.add_argument("input_dir")
+    p.add_argument("out_path")
+    p.add_argument("--block-size", type=int, default=1 << 16)
+    p.add_argument("--verify", action="store_true", help="Read every item back and compare it with its json file")
+    p = sub.add_parser("unpack", help="Write the json files of a pack back to a dir")
+    p.add_argument("pack_path")
+    p.add_argument("out_dir")
+    p = sub.add_parser("field", help="Print one field for every item")
+    p.add_argument("pack_path")
+    p.add_argument("name")
+    p = sub.add_parser("info", help="Show pack statistics")
+    p.add_argument("pack_path")
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        raw = sum(os.path.getsize(p) for p in glob.glob(os.path.join(args.input_dir, "*.json")))
+        stats = pack_dir(args.input_dir, args.out_path, args.block_size)
+        print(f"Packed {stats['items']} files ({raw} bytes) into {args.out_path}: {stats['bytes']} bytes, "
+              f"{stats['strings']} distinct strings in {stats['blocks']} blocks ({raw / stats['bytes']:.1f}x)")
+        if args.verify:
+            with TranscriptStore(args.out_path) as store:
+                bad = [key for key in store.keys
+                       if store.get(key) != json.load(open(os.path.join(args.input_dir, f"{key}.json"), "r",
+                                                           encoding="utf-8"))]
+            if bad:
+                raise SystemExit(f"{len(bad)} items differ after packing: {', '.join(bad[:10])}")
+            print(f"Verified {len(store.keys)} items")
+        return
+    with TranscriptStore(args.pack_path) as store:
+        if args.command == "unpack":
+            os.makedirs(args.out_dir, exist_ok=True)
+            for key, obj in store.items():
+                with open(os.path.join(args.out_dir, f"{key}.json"), "w", encoding="utf-8") as f:
+                    f.write(json.dumps(obj, ensure_ascii=False, indent=4))
+        elif args.command == "field":
+            for key, value in zip(store.keys, store.field(args.name)):
+                print(f"{key}\t{value}")
+        else:
+            print(f"items={len(store)} strings={store.header['n_strings']} blocks={store.header['n_blocks']}")
+            print(f"fields: {', '.join(store.fields)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+SQLite-backed work queue with lease/heartbeat semantics for multi-host debate runs.
+
+Every input line becomes one row.  A worker claims a row by taking a lease
+(``lease_expires``), keeps it alive with heartbeats while the debate runs and
+finally marks it done or failed.  Leases that expire (crashed or partitioned
+worker) are put back in the queue by the next claim.
+
+The database uses the default rollback journal instead of WAL because WAL needs
+shared memory and does not work on network file systems.
+"""
+
+import contextlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    item_key TEXT NOT NULL,
+    output_dir TEXT NOT NULL,
+    lang_pair TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    enqueued_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    error TEXT,
+    UNIQUE (output_dir, item_key)
+);
+CREATE INDEX IF NOT EXISTS items_state ON items (state, id);
+"""
+
+QUEUED, LEASED, DONE, FAILED = "queued", "leased", "done", "failed"
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    def __init__(self, path: str, lease_time: float = 600, max_attempts: int = 3, timeout: float = 60) -> None:
+        """Open (and create) a work queue
+
+        Args:
+            path (str): sqlite database file, usually on storage shared by all workers
+            lease_time (float): seconds a claim stays valid without a heartbeat
+            max_attempts (int): claims per item before it is marked failed
+            timeout (float): seconds to wait for the database lock
+        """
+        self.path = path
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # autocommit mode; write transactions are opened explicitly with BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def enqueue(self, items: "list[tuple[str, str]]", output_dir: str, lang_pair: str) -> int:
+        """Add (item_key, payload) pairs; items already in the queue for output_dir are skipped
+
+        Returns:
+            int: number of newly queued items
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO items (item_key, output_dir, lang_pair, payload, enqueued_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(str(key), output_dir, lang_pair, payload, now) for key, payload in items])
+            added = conn.total_changes - before
+            conn.execute("COMMIT")
+        return added
+
+    def requeue_expired(self, conn: sqlite3.Connection, now: float):
+        conn.execute("UPDATE items SET state = ?, worker = NULL, error = 'lease expired' "
+                     "WHERE state = ? AND lease_expires < ? AND attempts < ?",
+                     (QUEUED, LEASED, now, self.max_attempts))
+        conn.execute("UPDATE items SET state = ?, finished_at = ?, error = 'lease expired' "
+                     "WHERE state = ? AND lease_expires < ? AND attempts >= ?",
+                     (FAILED, now, LEASED, now, self.max_attempts))
+
+    def claim(self, worker: str) -> "sqlite3.Row | None":
+        """Lease the oldest queued item, or return None when nothing is left"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self.requeue_expired(conn, now)
+            row = conn.execute("SELECT id FROM items WHERE state = ? ORDER BY id LIMIT 1", (QUEUED,)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute("UPDATE items SET state = ?, worker = ?, lease_expires = ?, started_at = ?, "
+                         "attempts = attempts + 1 WHERE id = ?",
+                         (LEASED, worker, now + self.lease_time, now, row["id"]))
+            item = conn.execute("SELECT * FROM items WHERE id = ?", (row["id"],)).fetchone()
+            conn.execute("COMMIT")
+        return item
+
+    def _update_leased(self, item_id: int, worker: str, sql: str, params: tuple) -> bool:
+        with self._connect() as conn:
+            cur = conn.execute(f"UPDATE items SET {sql} WHERE id = ? AND worker = ? AND state = ?",
+                               params + (item_id, worker, LEASED))
+            return cur.rowcount == 1
+
+    def heartbeat(self, item_id: int, worker: str) -> bool:
+        """Extend the lease; False means the lease was lost (expired and re-queued)"""
+        return self._update_leased(item_id, worker, "lease_expires = ?", (time.time() + self.lease_time,))
+
+    def complete(self, item_id: int, worker: str) -> bool:
+        return self._update_leased(item_id, worker, "state = ?, finished_at = ?, error = NULL",
+                                   (DONE, time.time()))
+
+    def fail(self, item_id: int, worker: str, error: str) -> bool:
+        """Record an error; the item is re-queued until it has used up max_attempts"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT attempts FROM items WHERE id = ? AND worker = ? AND state = ?",
+                               (item_id, worker, LEASED)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return False
+            if row["attempts"] >= self.max_attempts:
+                conn.execute("UPDATE items SET state = ?, finished_at = ?, error = ? WHERE id = ?",
+                             (FAILED, time.time(), error, item_id))
+            else:
+                conn.execute("UPDATE items SET state = ?, worker = NULL, error = ? WHERE id = ?",
+                             (QUEUED, error, item_id))
+            conn.execute("COMMIT")
+        return True
+
+    def retry_failed(self) -> int:
+        """Put all failed items back in the queue with a fresh attempt budget"""
+        with self._connect() as conn:
+            cur = conn.execute("UPDATE items SET state = ?, attempts = 0, worker = NULL WHERE state = ?",
+                               (QUEUED, FAILED))
+            return cur.rowcount
+
+    def status(self, window: float = 600) -> dict:
+        """Counts per state, in-flight leases, recent failures and throughput"""
+        now = time.time()
+        with self._connect() as conn:
+            counts = {state: 0 for state in (QUEUED, LEASED, DONE, FAILED)}
+            for row in conn.execute("SELECT state, COUNT(*) AS n FROM items GROUP BY state"):
+                counts[row["state"]] = row["n"]
+            in_flight = [dict(r) for r in conn.execute(
+                "SELECT id, item_key, output_dir, worker, attempts, started_at, lease_expires FROM items "
+                "WHERE state = ? ORDER BY started_at", (LEASED,))]
+            failures = [dict(r) for r in conn.execute(
+                "SELECT id, item_key, output_dir, attempts, error FROM items "
+                "WHERE error IS NOT NULL AND state != ? ORDER BY id", (DONE,))]
+            done = conn.execute(
+                "SELECT COUNT(*) AS n, MIN(started_at) AS first, MAX(finished_at) AS last, "
+                "AVG(finished_at - started_at) AS latency FROM items WHERE state = ?", (DONE,)).fetchone()
+            recent = conn.execute("SELECT COUNT(*) AS n FROM items WHERE state = ? AND finished_at >= ?",
+                                  (DONE, now - window)).fetchone()["n"]
+        elapsed = (done["last"] - done["first"]) if done["n"] else 0
+        return {
+            "counts": counts,
+            "in_flight": in_flight,
+            "failures": failures,
+            "throughput_overall": done["n"] / elapsed * 60 if elapsed > 0 else 0.0,  # items / min
+            "throughput_recent": recent / window * 60,
+            "mean_latency": done["latency"] or 0.0,
+            "window": window,
+        }
+
+
+class Heartbeat:
+    """Background thread that keeps a lease alive while an item is being processed"""
+
+    def __init__(self, queue: WorkQueue, item_id: int, worker: str, interval: float) -> None:
+        self.queue = queue
+        self.item_id = item_id
+        self.worker = worker
+        self.interval = interval
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{item_id}", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if not self.queue.heartbeat(self.item_id, self.worker):
+                    self.lost = True
+                    return
+            except sqlite3.OperationalError as e:
+                # transient lock contention; the lease has slack for a missed beat
+                print(f"Warning: heartbeat for item {self.item_id} failed: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        return False
@@ -0,0 +1,316 @@
+"""
+Batch QA debates over CounterintuitiveQA (CIAR), the QA counterpart of code/debate4tran.py.
+
+Every question is debated with interactive.Debate on a bounded thread pool and saved to
+{output_dir}/{id}.json; ids that already have an output file are skipped, so an interrupted
+run is resumed by starting it again.  At the end all outputs are scored against the gold
+``answer`` list (and the known ``incorrect answer`` list) and the accuracy, latency and
+token totals are printed and written to {output_dir}/summary.json.
+
+    python debate4qa.py -k sk-... -o data/CounterintuitiveQA/output --workers 4
+    python debate4qa.py -o data/CounterintuitiveQA/output --score-only
+"""
+
+import argparse
+import copy
+import json
+import math
+import os
+import re
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from interactive import Debate
+from code.utils import tracing
+from code.utils.token_budget import TokenBudget
+from code.utils.hedging import Hedger
+
+MAD_path = os.path.dirname(os.path.abspath(__file__))
+
+# ----- answer matching -----
+
+_CONSTANTS = {"e": math.e, "pi": math.pi, "π": math.pi}
+_WORDS = {w: i for i, w in enumerate(
+    "zero one two three four five six seven eight nine ten eleven twelve thirteen fourteen fifteen sixteen "
+    "seventeen eighteen nineteen twenty".split())}
+_NUM = r"\d+(?:\.\d+)?|\.\d+"
+_THOUSANDS_RE = re.compile(r"(?<=\d),(?=\d{3}\b)")
+# a/b, a:b, 1/e
+_FRACTION_RE = re.compile(rf"(?<![\w.])({_NUM})\s*[/:]\s*({_NUM}|e|pi|π)(?![\w.])")
+_NUMBER_RE = re.compile(rf"(?<![\w.])({_NUM})\s*(%|percent\b)?")
+_WORD_RE = re.compile(r"\b(" + "|".join(_WORDS) + r")\b")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize(text) -> str:
+    text = _THOUSANDS_RE.sub("", str(text).lower())
+    return _SPACE_RE.sub(" ", text).strip(" .")
+
+
+def _decimals(s: str) -> int:
+    return len(s.split(".")[1]) if "." in s else 0
+
+
+def _tolerance(s: str) -> float:
+    # "0.67" stands for anything that rounds to it; integers and fractions are exact
+    return 0.5 * 10 ** -_decimals(s) if "." in s else 1e-9
+
+
+def extract_numbers(text) -> list:
+    """(value, tolerance) for every number in the text
+
+    Fractions/ratios and constants (``3/2``, ``1:1``, ``1/e``) are exact; percentages count as
+    both ``x/100`` and ``x`` since answers like "66.67" are percentages without the sign.
+    """
+    text = normalize(text)
+    numbers = []
+
+    def fraction(m):
+        den = _CONSTANTS[m.group(2)] if m.group(2) in _CONSTANTS else float(m.group(2))
+        if den:
+            numbers.append((float(m.group(1)) / den, 1e-9))
+        return " "
+
+    text = _FRACTION_RE.sub(fraction, text)
+    for m in _NUMBER_RE.finditer(text):
+        value, tol = float(m.group(1)), _tolerance(m.group(1))
+        numbers.append((value, tol))
+        if m.group(2):
+            numbers.append((value / 100, tol / 100))
+    if not numbers:
+        # spelled out numbers only count when there are no digits ("one bar" is not an answer of 1)
+        numbers.extend((float(_WORDS[w]), 1e-9) for w in _WORD_RE.findall(text))
+    return numbers
+
+
+class AnswerMatcher:
+    def __init__(self, answers: list) -> None:
+        """Matches predictions against a list of equivalent answers (parsed once)
+
+        A numeric answer matches when every number in it equals some number of the prediction
+        within the precision of the less precise of the two (``0.67`` matches ``2/3``, ``75%``
+        matches ``0.75``); an answer without numbers matches when its normalized text occurs
+        in the prediction.
+
+        Args:
+            answers (list): equivalent answers, e.g. ["0.75", "75%", "3/4"]
+        """
+        self.numbers = []
+        self.patterns = []
+        for answer in answers:
+            if not str(answer).strip():
+                continue
+            numbers = self._answer_numbers(answer)
+            if numbers:
+                self.numbers.append(numbers)
+            else:
+                self.patterns.append(re.compile(r"(?<![\w.])" + re.escape(normalize(answer)) + r"(?![\w.])"))
+
+    @staticmethod
+    def _answer_numbers(answer) -> list:
+        # an answer "75%" must not also accept 75, so keep only the interpretation it was written in
+        text = normalize(answer)
+        m = _NUMBER_RE.fullmatch(text)
+        if m and m.group(2):
+            return [(float(m.group(1)) / 100, _tolerance(m.group(1)) / 100)]
+        return extract_numbers(text)
+
+    def match(self, prediction: str, pred_numbers: list = None) -> "tuple | None":
+        """None if nothing matches, else a sort key of the best match (smaller is closer)"""
+        text = normalize(prediction)
+        if any(p.search(text) for p in self.patterns):
+            return (0.0, 0)
+        if pred_numbers is None:
+            pred_numbers = extract_numbers(text)
+        best = None
+        for answer in self.numbers:
+            dists = []
+            for g, gt in answer:
+                d = min((abs(v - g) for v, t in pred_numbers if abs(v - g) <= max(t, gt) + 1e-12), default=None)
+                if d is None:
+                    break
+                dists.append(d / max(abs(g), 1e-9))
+            else:
+                # answers with more numbers ("6 or 12") are the more specific match
+                key = (max(dists), -len(answer))
+                best = key if best is None else min(best, key)
+        return best
+
+
+def score_answer(prediction, answers: list, incorrect: list = ()) -> str:
+    """Label a debate answer: correct, known_incorrect (one of the listed wrong answers),
+    other (neither, or equally close to both) or no_answer
+
+    When both lists match (``0.0909`` is also "0.1" rounded) the closer match wins.
+    """
+    if prediction is None or not str(prediction).strip():
+        return "no_answer"
+    pred_numbers = extract_numbers(prediction)
+    right = AnswerMatcher(answers).match(prediction, pred_numbers)
+    wrong = AnswerMatcher(incorrect).match(prediction, pred_numbers) if incorrect else None
+    if right is not None and (wrong is None or right < wrong):
+        return "correct"
+    if wrong is not None and (right is None or wrong < right):
+        return "known_incorrect"
+    return "other"
+
+
+# ----- running -----
+
+def debate_item(id, item: dict, config: dict, save_file_dir: str, openai_api_key: str, **debate_kwargs) -> dict:
+    """Run the debate for one CIAR question and save it to {save_file_dir}/{id}.json"""
+    config = copy.deepcopy(config)
+    config["debate_topic"] = item["question"]
+    with tracing.span("item", sample=True, id=id):
+        debate = Debate(num_players=3, openai_api_key=openai_api_key, config=config, **debate_kwargs)
+        debate.run()
+    result = {"id": id, **debate.config,
+              "players": {player.name: player.memory_lst for player in debate.players}}
+    # write-then-rename so an interrupted run never leaves a half written (and skipped) file
+    path = os.path.join(save_file_dir, f"{id}.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=4)
+    os.replace(path + ".tmp", path)
+    return result
+
+
+def load_output(save_file_dir: str, id):
+    path = os.path.join(save_file_dir, f"{id}.json")
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        return None
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[max(0, math.ceil(q * len(values)) - 1)] if values else 0.0
+
+
+def summarize(items: list, save_file_dir: str) -> "tuple[dict, list]":
+    rows = []
+    for id, item in enumerate(items):
+        out = load_output(save_file_dir, id)
+        if out is None:
+            continue
+        label = score_answer(out.get("debate_answer"), item["answer"], item.get("incorrect answer", []))
+        base = score_answer(out.get("base_answer"), item["answer"], item.get("incorrect answer", []))
+        usage = out.get("usage") or {}
+        rows.append({"id": id, "label": label, "base_label": base, "debate_answer": out.get("debate_answer"),
+                     "answer": item["answer"], "latency": out.get("latency") or 0.0,
+                     "slo_missed": bool(out.get("slo_missed")),
+                     "calls": sum(u.get("calls", 0) for u in usage.values()),
+                     "prompt_tokens": sum(u.get("prompt_tokens", 0) for u in usage.values()),
+                     "completion_tokens": sum(u.get("completion_tokens", 0) for u in usage.values())})
+
+    n = len(rows)
+    labels = [r["label"] for r in rows]
+    latencies = [r["latency"] for r in rows]
+    summary = {
+        "items": len(items),
+        "scored": n,
+        "accuracy": labels.count("correct") / n if n else 0.0,
+        "base_accuracy": [r["base_label"] for r in rows].count("correct") / n if n else 0.0,
+        "labels": {k: labels.count(k) for k in ("correct", "known_incorrect", "other", "no_answer")},
+        "slo_missed": sum(r["slo_missed"] for r in rows),
+        "latency": {"mean": sum(latencies) / n if n else 0.0, "p50": percentile(latencies, 0.5),
+                    "p95": percentile(latencies, 0.95), "total": sum(latencies)},
+        "tokens": {k: sum(r[k] for r in rows) for k in ("calls", "prompt_tokens", "completion_tokens")},
+    }
+    return summary, rows
+
+
+def parse_args():
+    parser = argparse.ArgumentParser("", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument("-i", "--input-file", type=str,
+                        default=os.path.join(MAD_path, "data", "CounterintuitiveQA", "CIAR.json"),
+                        help="CIAR json file")
+    parser.add_argument("-o", "--output-dir", type=str, required=True, help="Output file dir")
+    parser.add_argument("-k", "--api-key", type=str, default=None, help="OpenAI api key")
+    parser.add_argument("-m", "--model-name", type=str, default="deepseek-chat", help="Model name")
+    parser.add_argument("-t", "--temperature", type=float, default=0, help="Sampling temperature")
+    parser.add_argument("--max-round", type=int, default=3, help="Maximum rounds of debate")
+    parser.add_argument("--workers", type=int, default=4, help="Debates running at the same time")
+    parser.add_argument("--limit", type=int, default=None, help="Only the first N questions")
+    parser.add_argument("--score-only", action="store_true", help="Score existing outputs without running debates")
+    parser.add_argument("--deadline", type=float, default=None, help="Latency budget per question in seconds")
+    parser.add_argument("--call-timeout", type=float, default=None, help="Timeout per API call in seconds")
+    parser.add_argument("--trace-file", type=str, default=os.environ.get(tracing.TRACE_FILE_ENV),
+                        help="Write Chrome trace-event spans to this file")
+    parser.add_argument("--trace-sample-rate", type=float,
+                        default=float(os.environ.get(tracing.TRACE_SAMPLE_RATE_ENV, 1.0)),
+                        help="Fraction of questions whose spans are recorded")
+    parser.add_argument("--two-step-moderator", action="store_true",
+                        help="Moderator answers only Yes/No after each round and gives the full verdict when the "
+                             "debate ends (overrides moderator_decision.enabled in the config)")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Re-send API calls that are slower than the p95 latency of their role and take the "
+                             "first answer (extra requests capped by hedging.max_extra in the config)")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    tracing.configure(args.trace_file, args.trace_sample_rate)
+
+    with open(args.input_file, "r", encoding="utf-8") as f:
+        items = json.load(f)[:args.limit]
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    if not args.score_only:
+        if not args.api_key:
+            raise SystemExit("An API key is required (-k) unless --score-only is given")
+        with open(os.path.join(MAD_path, "code", "utils", "config4all.json"), "r", encoding="utf-8") as f:
+            config = json.load(f)
+        token_budget = TokenBudget.from_config(config)
+        if args.two_step_moderator:
+            config.setdefault("moderator_decision", {})["enabled"] = True
+        hedger = Hedger.from_config(config, concurrency=args.workers)
+        if args.hedge:
+            hedger.enabled = True
+        todo = [id for id in range(len(items)) if load_output(args.output_dir, id) is None]
+        print(f"{len(items) - len(todo)} questions already done, {len(todo)} to go")
+
+        start, failed = time.time(), []
+        with tracing.span("run", input_file=args.input_file, items=len(todo)), \
+                ThreadPoolExecutor(max_workers=args.workers) as pool:
+            futures = {pool.submit(debate_item, id, items[id], config, args.output_dir, args.api_key,
+                                   model_name=args.model_name, temperature=args.temperature,
+                                   max_round=args.max_round, sleep_time=0, deadline=args.deadline,
+                                   call_timeout=args.call_timeout, token_budget=token_budget,
+                                   hedger=hedger): id for id in todo}
+            for done, future in enumerate(as_completed(futures), 1):
+                id = futures[future]
+                try:
+                    future.result()
+                except Exception:
+                    traceback.print_exc()
+                    failed.append(id)
+                print(f"[{done}/{len(todo)}] question {id} {'failed' if id in failed else 'done'}")
+        tracing.flush()
+        wall = time.time() - start
+        print(f"Ran {len(todo) - len(failed)} debates in {wall:.1f}s "
+              f"({(len(todo) - len(failed)) / wall * 60 if wall else 0:.1f}/min)")
+        if failed:
+            print(f"{len(failed)} questions failed and will be retried on the next run: {sorted(failed)}")
+        if hedger.enabled:
+            print(f"hedging: {hedger.summary()}")
+
+    summary, rows = summarize(items, args.output_dir)
+    with open(os.path.join(args.output_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump({"summary": summary, "items": rows}, f, ensure_ascii=False, indent=4)
+
+    print("\n===== CIAR results =====")
+    print(f"scored {summary['scored']}/{summary['items']}  accuracy {summary['accuracy']:.2%}  "
+          f"(base answer {summary['base_accuracy']:.2%})  labels {summary['labels']}")
+    lat = summary["latency"]
+    print(f"latency mean {lat['mean']:.1f}s  p50 {lat['p50']:.1f}s  p95 {lat['p95']:.1f}s  "
+          f"missed deadline {summary['slo_missed']}")
+    tok = summary["tokens"]
+    print(f"tokens prompt {tok['prompt_tokens']}  completion {tok['completion_tokens']}  calls {tok['calls']}")
@@ -16,6 +16,12 @@ import json
 import random
 # random.seed(0)
 from code.utils.agent import Agent
+from code.utils import tracing
+from code.utils.deadline import Deadline, DeadlineExceededException
+from code.utils.token_budget import TokenBudget
+from code.utils.hedging import Hedger
+from code.utils.decision import ModeratorDecision
+from code.utils.model_router import ModelRouter, format_role_stats
 import ast
 import re
 
@@ -26,10 +32,19 @@ NAME_LIST = [
     "Negative side",
     "Moderator",
 ]
+# 角色名 -> config 里按角色配置的键（如 "max_tokens"）
+ROLE_KEYS = {
+    "Affirmative side": "affirmative",
+    "Negative side": "negative",
+    "Moderator": "moderator",
+    "Escalated Moderator": "moderator",
+    "Judge": "judge",
+}
 
 
 class DebatePlayer(Agent):
-    def __init__(self, model_name: str, name: str, temperature: float, openai_api_key: str, sleep_time: float) -> None:
+    def __init__(self, model_name: str, name: str, temperature: float, openai_api_key: str, sleep_time: float,
+                 **kwargs) -> None:
         # model_name：要调用的模型名 name：角色名（正方/反方/主持人）
         """Create a player in the debate
 
@@ -39,8 +54,10 @@ class DebatePlayer(Agent):
             temperature (float): higher values make the output more random, while lower values make it more focused and deterministic
             openai_api_key (str): As the parameter name suggests
             sleep_time (float): sleep because of rate limits
+            **kwargs: further Agent options (timeout, deadline, token_budget, hedger, on_message)
         """
-        super(DebatePlayer, self).__init__(model_name, name, temperature, sleep_time)
+        super(DebatePlayer, self).__init__(model_name, name, temperature, sleep_time, role=ROLE_KEYS.get(name),
+                                           **kwargs)
         self.openai_api_key = openai_api_key
 
 def safe_parse_dict(text: str) -> dict:
@@ -106,7 +123,13 @@ class Debate:
                  openai_api_key: str = None,
                  config: dict = None,  # config=None：prompt 配置（来自 config4all.json）
                  max_round: int = 3,
-                 sleep_time: float = 0
+                 sleep_time: float = 0,
+                 deadline: float = None,  # 整场辩论的时间预算（秒），超时后退回主持人结论或 base_answer
+                 call_timeout: float = None,  # 单次 API 调用超时（秒）
+                 token_budget: TokenBudget = None,  # 按角色的 max_tokens 预算，默认取 config["max_tokens"]
+                 router: ModelRouter = None,  # 按角色选模型 + 升级模型，默认取 config["role_models"] / config["escalation"]
+                 hedger: Hedger = None,  # 慢请求对冲（超过该角色 p95 延迟就再发一次，取先返回的），默认取 config["hedging"]
+                 on_turn=None  # 每个发言之后的回调 on_turn(角色名, 内容)，用于流式输出
                  ) -> None:
         """Create a debate
 
@@ -117,6 +140,12 @@ class Debate:
             openai_api_key (str): As the parameter name suggests
             max_round (int): maximum Rounds of Debate
             sleep_time (float): sleep because of rate limits
+            deadline (float): latency budget in seconds for the whole debate
+            call_timeout (float): timeout in seconds for a single API call
+            token_budget (TokenBudget): per-role max_tokens budgets shared across debates
+            router (ModelRouter): per-role models and escalation, defaults to the prompt config
+            hedger (Hedger): hedged API calls shared across debates, defaults to the prompt config
+            on_turn: callback(player_name, answer) invoked after every answer
         """
 
         self.model_name = model_name
@@ -126,12 +155,41 @@ class Debate:
         self.config = config
         self.max_round = max_round
         self.sleep_time = sleep_time
+        self.call_timeout = call_timeout
+        self.on_turn = on_turn
+        self.deadline = Deadline(deadline)
+        self.timed_out = False
+        self.players = []
+        self.mod_ans = {}
+        self.config.setdefault('base_answer', '')
+        self.config['slo_missed'] = False
+        self.config['escalated'] = False
+        self.config['moderator_decisions'] = []
+        self.token_budget = token_budget if token_budget is not None else TokenBudget.from_config(self.config)
+        self.router = router if router is not None else ModelRouter.from_config(self.config, model_name)
+        self.hedger = hedger if hedger is not None else Hedger.from_config(self.config)
+        self.decision = ModeratorDecision.from_config(self.config)  # 两步主持人：先 Yes/No，结束时才要完整结论
+        self.last_moderator_prompt = None
 
         self.init_prompt()  # 对 config 里的 prompt 模板做替换
 
-        # creat&init agents
-        self.creat_agents() # 创建 3 个 DebatePlayer
-        self.init_agents()  # 给每个 agent 设置 meta prompt，然后跑第一轮辩论
+        try:
+            # creat&init agents
+            self.creat_agents() # 创建 3 个 DebatePlayer
+            self.init_agents()  # 给每个 agent 设置 meta prompt，然后跑第一轮辩论
+        except DeadlineExceededException as e:
+            print(f"Warning: {e}")
+            self.timed_out = True
+
+    def new_player(self, name: str, model_name: str = None) -> DebatePlayer:
+        role = ROLE_KEYS.get(name)
+        model_name = model_name or self.router.model(role)  # 例如 judge 用推理模型
+        # 换了模型的角色（路由 / 升级，如推理模型）单独一个预算键，默认不限长度
+        budget_key = f"{role}@{model_name}" if role and model_name != self.model_name else role
+        return DebatePlayer(model_name=model_name, name=name, temperature=self.temperature,
+                            openai_api_key=self.openai_api_key, sleep_time=self.sleep_time,
+                            timeout=self.call_timeout, deadline=self.deadline, token_budget=self.token_budget,
+                            hedger=self.hedger, on_message=self.on_turn, budget_key=budget_key)
 
     def init_prompt(self):
         def prompt_replace(key):
@@ -145,10 +203,7 @@ class Debate:
 
     def creat_agents(self):
         # creates players
-        self.players = [
-            DebatePlayer(model_name=self.model_name, name=name, temperature=self.temperature,
-                         openai_api_key=self.openai_api_key, sleep_time=self.sleep_time) for name in NAME_LIST
-        ]
+        self.players = [self.new_player(name) for name in NAME_LIST]
         self.affirmative = self.players[0]
         self.negative = self.players[1]
         self.moderator = self.players[2]
@@ -173,15 +228,37 @@ class Debate:
         self.neg_ans = self.negative.ask()
         self.negative.add_memory(self.neg_ans)
 
-        self.moderator.add_event(
-            self.config['moderator_prompt'].replace('##aff_ans##', self.aff_ans).replace('##neg_ans##',
-                                                                                         self.neg_ans).replace(
-                '##round##', 'first'))
+        self.moderate(1)
+
+    def moderate(self, num: int):
+        """The moderator's verdict on round ``num``; in two-step mode (config["moderator_decision"]) a few-token
+        Yes/No decision first, and the full JSON verdict only when it says Yes"""
+        def fill(key):
+            return self.config[key].replace('##aff_ans##', self.aff_ans).replace(
+                '##neg_ans##', self.neg_ans).replace('##round##', self.round_dct(num))
+
+        self.last_moderator_prompt = fill('moderator_prompt')
+        if self.decision.active(self.moderator.model_name):
+            # 先只问“是否已有明确倾向”（几个 token，能拿到 logprobs 时按 P(Yes) 判断）
+            self.moderator.add_event(fill('moderator_decision_prompt'))
+            ans = self.moderator.ask(max_tokens=self.decision.max_tokens,
+                                     logprobs=self.decision.use_logprobs(self.moderator.model_name))
+            self.moderator.add_memory(ans)
+            decided, p_yes = self.decision.parse(ans, self.moderator.last_logprobs)
+            self.config['moderator_decisions'].append({"round": num, "answer": ans, "p_yes": p_yes})
+            if decided is False:
+                self.mod_ans = {"Whether there is a preference": "No", "Supported Side": "", "Reason": "",
+                                "debate_answer": ""}
+                return
+            # Yes（或回答不明确）：辩论要结束了，再要完整的 JSON 结论
+            self.moderator.add_event(self.config['moderator_verdict_prompt'])
+        else:
+            self.moderator.add_event(self.last_moderator_prompt)
         self.mod_ans = self.moderator.ask()
         self.moderator.add_memory(self.mod_ans)
         # self.mod_ans = eval(self.mod_ans)
-        # self.mod_ans = json.loads(self.mod_ans)
-        self.mod_ans = safe_parse_dict(self.mod_ans)
+        with tracing.span("parse_verdict"):
+            self.mod_ans = safe_parse_dict(self.mod_ans)
 
     def round_dct(self, num: int):
         dct = {
@@ -200,6 +277,10 @@ class Debate:
         print(self.config["debate_answer"])
         print("\n----- Debate Reason -----")
         print(self.config["Reason"])
+        if self.config.get("slo_missed"):
+            print(f"\n(deadline exceeded after {self.deadline.elapsed():.1f}s, answer from {self.config['degraded_to']})")
+        print("\n----- Roles -----")
+        print(format_role_stats(self.config['role_stats']))
 
     def broadcast(self, msg: str):
         """Broadcast a message to all players. 
@@ -233,6 +314,48 @@ class Debate:
 
     def run(self):
 
+        try:
+            if not self.timed_out:
+                self.debate()
+        except DeadlineExceededException as e:
+            print(f"Warning: {e}")
+            self.timed_out = True
+        if self.timed_out:
+            self.degrade()
+        self.config['latency'] = round(self.deadline.elapsed(), 3)
+        self.config['usage'] = {player.name: player.usage for player in self.players}
+        self.config['role_stats'] = self.router.role_stats(self.players)
+
+        self.print_answer()
+
+    def escalate(self):
+        """The moderator found no preference: ask its escalation model the same question once before the judge"""
+        player = self.new_player('Escalated Moderator', self.router.escalation_model("moderator"))
+        # 主持人的对话，去掉最后那次“无倾向”的回答，并换成完整的结论问题（两步模式下最后问的可能只是 Yes/No）
+        player.memory_lst = [dict(m) for m in self.moderator.memory_lst[:-1]]
+        player.memory_lst[-1]["content"] = self.last_moderator_prompt
+        self.players.append(player)
+        self.config['escalated'] = True
+        ans = player.ask()
+        player.add_memory(ans)
+        with tracing.span("parse_verdict"):
+            ans = safe_parse_dict(ans)
+        if ans.get("debate_answer", '') != '':
+            self.mod_ans = ans
+
+    def degrade(self):
+        """Out of time: keep the latest moderator verdict if it has an answer, else the base answer"""
+        tracing.instant("deadline_exceeded", budget=self.deadline.budget)
+        self.config['slo_missed'] = True
+        if self.mod_ans.get("debate_answer", '') != '':
+            self.config.update(self.mod_ans)
+            self.config['degraded_to'] = 'moderator'
+        else:
+            self.config['debate_answer'] = self.config['base_answer']
+            self.config['degraded_to'] = 'base_answer'
+        self.config.setdefault('Reason', f"Deadline exceeded, fell back to the {self.config['degraded_to']}.")
+
+    def debate(self):
         for round in range(self.max_round - 1):
 
             if self.mod_ans["debate_answer"] != '':
@@ -247,14 +370,12 @@ class Debate:
                 self.neg_ans = self.negative.ask()
                 self.negative.add_memory(self.neg_ans)
 
-                self.moderator.add_event(
-                    self.config['moderator_prompt'].replace('##aff_ans##', self.aff_ans).replace('##neg_ans##',
-                                                                                                 self.neg_ans).replace(
-                        '##round##', self.round_dct(round + 2)))
-                self.mod_ans = self.moderator.ask()
-                self.moderator.add_memory(self.mod_ans)
-                # self.mod_ans = eval(self.mod_ans)
-                self.mod_ans = safe_parse_dict(self.mod_ans)
+                self.moderate(round + 2)
+
+        # 主持人仍无倾向：先让更强的模型（config["escalation"]）重新裁决一次，仍不行再交给 Judge
+        if self.mod_ans["debate_answer"] == '' and self.router.escalation_model("moderator"):
+            with tracing.span("escalate", cat="round"):
+                self.escalate()
 
         if self.mod_ans["debate_answer"] != '':
             self.config.update(self.mod_ans)
@@ -262,8 +383,7 @@ class Debate:
 
         # ultimate deadly technique.
         else:
-            judge_player = DebatePlayer(model_name=self.model_name, name='Judge', temperature=self.temperature,
-                                        openai_api_key=self.openai_api_key, sleep_time=self.sleep_time)
+            judge_player = self.new_player('Judge')
             aff_ans = self.affirmative.memory_lst[2]['content']
             neg_ans = self.negative.memory_lst[2]['content']
 
@@ -281,7 +401,8 @@ class Debate:
             judge_player.add_memory(ans)
 
             # ans = eval(ans)
-            ans = safe_parse_dict(ans)
+            with tracing.span("parse_verdict"):
+                ans = safe_parse_dict(ans)
 
             if ans["debate_answer"] != '':
                 self.config['success'] = True
@@ -289,14 +410,18 @@ class Debate:
             self.config.update(ans)
             self.players.append(judge_player)
 
-        self.print_answer()
-
 
 if __name__ == "__main__":
 
     current_script_path = os.path.abspath(__file__)
     # MAD_path = current_script_path.rsplit("/", 1)[0]
     MAD_path = os.path.dirname(current_script_path)
+    tracing.configure_from_env()  # MAD_TRACE_FILE=trace.json python interactive.py
+    # 每个辩题的时间预算 / 单次调用超时（秒），例如 MAD_DEADLINE=120 MAD_CALL_TIMEOUT=30
+    deadline = float(os.environ["MAD_DEADLINE"]) if os.environ.get("MAD_DEADLINE") else None
+    call_timeout = float(os.environ["MAD_CALL_TIMEOUT"]) if os.environ.get("MAD_CALL_TIMEOUT") else None
+    token_budget = None  # 跨辩题共享，学习到的预算可以延续
+    hedger = None  # 同上，延迟分布跨辩题累积
 
     while True:
         debate_topic = ""
@@ -315,6 +440,14 @@ if __name__ == "__main__":
             break
 
         config['debate_topic'] = debate_topic
-
-        debate = Debate(num_players=3, openai_api_key=openai_api_key, config=config, temperature=0, sleep_time=0)
-        debate.run()
+        if token_budget is None:
+            token_budget = TokenBudget.from_config(config)
+        if hedger is None:
+            hedger = Hedger.from_config(config)
+
+        with tracing.span("debate", sample=True, topic=debate_topic):
+            debate = Debate(num_players=3, openai_api_key=openai_api_key, config=config, temperature=0, sleep_time=0,
+                            deadline=deadline, call_timeout=call_timeout, token_budget=token_budget,
+                            hedger=hedger)
+            debate.run()
+        tracing.flush()
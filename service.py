@@ -0,0 +1,328 @@
+"""
+Long-running debate service: the HTTP counterpart of interactive.py.
+
+Prompt configs are loaded once and API clients are shared (code.utils.agent.get_client),
+debates run concurrently on a bounded thread pool, and every turn is streamed to clients
+as server-sent events while the debate is still running.  When more than ``--max-queue``
+jobs are waiting for a worker, new jobs are rejected with 429 so bursts do not pile up
+on the upstream API.
+
+    python service.py -k sk-... --port 8000 --concurrency 4
+
+    POST /debates        {"topic": "...", "max_round": 3}
+    POST /translations   {"source": "...", "reference": "", "lang_pair": "zh-en"}
+    GET  /jobs/<id>          status and result
+    GET  /jobs/<id>/events   text/event-stream: "turn" events, then one "done" event
+    GET  /health             running / queued jobs and capacity (and hedging stats when enabled)
+"""
+
+import argparse
+import asyncio
+import copy
+import itertools
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import interactive
+from code import debate4tran
+from code.utils import tracing
+
+MAD_path = os.path.dirname(os.path.abspath(__file__))
+
+# fields of the final config/save file returned to clients (players' memories are streamed instead)
+RESULT_FIELDS = {
+    "debate": ["debate_topic", "base_answer", "debate_answer", "Reason", "Supported Side", "success",
+               "slo_missed", "latency", "usage"],
+    "translation": ["source", "reference", "src_lng", "tgt_lng", "base_translation", "debate_translation", "Reason",
+                    "Supported Side", "success", "slo_missed", "latency", "usage"],
+}
+
+
+class Job:
+    def __init__(self, id: str, kind: str, params: dict) -> None:
+        self.id = id
+        self.kind = kind
+        self.params = params
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.events = []
+        self.result = None
+        self.error = None
+        self.subscribers = set()
+
+    def publish(self, event: str, data: dict):
+        """Record an event and wake up the SSE streams (runs on the event loop)"""
+        self.events.append((event, data))
+        for queue in self.subscribers:
+            queue.put_nowait((event, data))
+
+    def summary(self) -> dict:
+        return {"id": self.id, "kind": self.kind, "status": self.status, "created": self.created,
+                "started": self.started, "finished": self.finished, "turns": len(self.events),
+                "result": self.result, "error": self.error}
+
+
+class DebateService:
+    def __init__(self, api_key: str, concurrency: int = 4, max_queue: int = 16, deadline: float = None,
+                 call_timeout: float = None, model_name: str = "deepseek-chat", keep_jobs: int = 1000) -> None:
+        """Create the service
+
+        Args:
+            api_key (str): upstream API key
+            concurrency (int): debates running at the same time
+            max_queue (int): jobs allowed to wait for a worker before new ones are rejected
+            deadline (float): per-debate latency budget in seconds
+            call_timeout (float): per-call timeout in seconds
+            model_name (str): model name
+            keep_jobs (int): finished jobs kept for GET /jobs/<id>
+        """
+        self.api_key = api_key
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self.call_timeout = call_timeout
+        self.model_name = model_name
+        self.keep_jobs = keep_jobs
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="debate")
+        self.jobs = {}
+        self.running = 0
+        self.queued = 0
+        self._ids = itertools.count(1)
+        self.loop = None
+
+        # loaded once; every job works on a deep copy
+        with open(os.path.join(MAD_path, "code", "utils", "config4all.json"), "r", encoding="utf-8") as f:
+            self.qa_config = json.load(f)
+        with open(os.path.join(MAD_path, "code", "utils", "config4tran.json"), "r", encoding="utf-8") as f:
+            self.tran_config = json.load(f)
+        self.qa_budget = interactive.TokenBudget.from_config(self.qa_config)
+        self.tran_budget = debate4tran.TokenBudget.from_config(self.tran_config)
+        self.qa_hedger = interactive.Hedger.from_config(self.qa_config, concurrency)
+        self.tran_hedger = debate4tran.Hedger.from_config(self.tran_config, concurrency)
+        self.lang_cache = {}
+
+    # ----- jobs -----
+
+    def submit(self, kind: str, params: dict) -> Job:
+        if self.queued >= self.max_queue:
+            raise OverflowError(f"{self.queued} jobs already waiting")
+        job = Job(str(next(self._ids)), kind, params)
+        self.jobs[job.id] = job
+        self.queued += 1
+        self._forget_old_jobs()
+        future = self.loop.run_in_executor(self.executor, self._run_job, job)
+        future.add_done_callback(lambda f: self._finish(job, f))
+        return job
+
+    def _forget_old_jobs(self):
+        finished = [j for j in self.jobs.values() if j.finished is not None]
+        for job in sorted(finished, key=lambda j: j.finished)[:max(0, len(finished) - self.keep_jobs)]:
+            del self.jobs[job.id]
+
+    def _run_job(self, job: Job) -> dict:
+        """Runs on a worker thread"""
+        self.loop.call_soon_threadsafe(self._start, job)
+
+        def on_turn(name, content):
+            self.loop.call_soon_threadsafe(job.publish, "turn", {"speaker": name, "content": content})
+
+        with tracing.span("item", sample=True, job=job.id, kind=job.kind):
+            if job.kind == "debate":
+                return self._run_debate(job.params, on_turn)
+            return self._run_translation(job.params, on_turn)
+
+    def _run_debate(self, params: dict, on_turn) -> dict:
+        config = copy.deepcopy(self.qa_config)
+        config["debate_topic"] = params["topic"]
+        debate = interactive.Debate(model_name=params.get("model_name", self.model_name), num_players=3,
+                                    openai_api_key=self.api_key, config=config,
+                                    max_round=int(params.get("max_round", 3)),
+                                    temperature=float(params.get("temperature", 0)), sleep_time=0,
+                                    deadline=params.get("deadline") or self.deadline, call_timeout=self.call_timeout,
+                                    token_budget=self.qa_budget, hedger=self.qa_hedger, on_turn=on_turn)
+        debate.run()
+        return {k: debate.config.get(k) for k in RESULT_FIELDS["debate"]}
+
+    def _run_translation(self, params: dict, on_turn) -> dict:
+        lang_pair = params.get("lang_pair", "zh-en")
+        if lang_pair not in self.lang_cache:
+            self.lang_cache[lang_pair] = debate4tran.lang_names(lang_pair)
+        prompts = copy.deepcopy(self.tran_config)
+        prompts["source"] = params["source"]
+        prompts["reference"] = params.get("reference", "")
+        prompts["src_lng"], prompts["tgt_lng"] = self.lang_cache[lang_pair]
+        debate = debate4tran.Debate(model_name=params.get("model_name", self.model_name), num_players=3,
+                                    openai_api_key=self.api_key, prompts=prompts,
+                                    max_round=int(params.get("max_round", 3)),
+                                    temperature=float(params.get("temperature", 0)), sleep_time=0,
+                                    deadline=params.get("deadline") or self.deadline, call_timeout=self.call_timeout,
+                                    token_budget=self.tran_budget, hedger=self.tran_hedger, on_turn=on_turn)
+        debate.run()
+        return {k: debate.save_file.get(k) for k in RESULT_FIELDS["translation"]}
+
+    def _start(self, job: Job):
+        self.queued -= 1
+        self.running += 1
+        job.status = "running"
+        job.started = time.time()
+
+    def _finish(self, job: Job, future):
+        self.running -= 1
+        job.finished = time.time()
+        try:
+            job.result = future.result()
+            job.status = "done"
+        except Exception as e:
+            traceback.print_exception(e)
+            job.status = "failed"
+            job.error = f"{type(e).__name__}: {e}"
+        job.publish("done", job.summary())
+
+    def health(self) -> dict:
+        health = {"running": self.running, "queued": self.queued, "concurrency": self.concurrency,
+                  "max_queue": self.max_queue, "jobs": len(self.jobs)}
+        if self.qa_hedger.enabled or self.tran_hedger.enabled:
+            health["hedging"] = {"debate": self.qa_hedger.summary(), "translation": self.tran_hedger.summary()}
+        return health
+
+    # ----- HTTP -----
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").strip()
+            if not request_line:
+                return
+            method, path, _ = request_line.split(" ", 2)
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1")
+                if line in ("\r\n", "\n", ""):
+                    break
+                key, _, value = line.partition(":")
+                headers[key.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+            await self.route(method, path.split("?", 1)[0].rstrip("/"), body, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            traceback.print_exception(e)
+            await self.respond(writer, HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)})
+        finally:
+            writer.close()
+
+    async def route(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter):
+        parts = path.strip("/").split("/")
+        if method == "GET" and path == "/health":
+            return await self.respond(writer, HTTPStatus.OK, self.health())
+        if method == "POST" and path in ("/debates", "/translations"):
+            try:
+                params = json.loads(body or b"{}")
+            except json.JSONDecodeError as e:
+                return await self.respond(writer, HTTPStatus.BAD_REQUEST, {"error": f"invalid json: {e}"})
+            kind, required = ("debate", "topic") if path == "/debates" else ("translation", "source")
+            if not str(params.get(required, "")).strip():
+                return await self.respond(writer, HTTPStatus.BAD_REQUEST, {"error": f"'{required}' is required"})
+            if params.get("deadline") is not None:
+                try:
+                    params["deadline"] = float(params["deadline"])
+                    if not params["deadline"] > 0:
+                        raise ValueError(params["deadline"])
+                except (TypeError, ValueError):
+                    return await self.respond(writer, HTTPStatus.BAD_REQUEST,
+                                              {"error": "'deadline' must be a positive number of seconds"})
+            try:
+                job = self.submit(kind, params)
+            except OverflowError as e:
+                return await self.respond(writer, HTTPStatus.TOO_MANY_REQUESTS, {"error": str(e), **self.health()},
+                                          extra_headers={"Retry-After": "5"})
+            return await self.respond(writer, HTTPStatus.ACCEPTED,
+                                      {"id": job.id, "status": job.status, "events": f"/jobs/{job.id}/events"})
+        if method == "GET" and len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self.jobs.get(parts[1])
+            if job is None:
+                return await self.respond(writer, HTTPStatus.NOT_FOUND, {"error": f"no job {parts[1]}"})
+            if len(parts) == 2:
+                return await self.respond(writer, HTTPStatus.OK, job.summary())
+            if parts[2] == "events":
+                return await self.stream(job, writer)
+        return await self.respond(writer, HTTPStatus.NOT_FOUND, {"error": f"no route for {method} {path}"})
+
+    async def respond(self, writer: asyncio.StreamWriter, status: HTTPStatus, payload: dict, extra_headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json; charset=utf-8", "Content-Length": str(len(body)),
+                   "Connection": "close", **(extra_headers or {})}
+        writer.write(self._head(status, headers) + body)
+        await writer.drain()
+
+    @staticmethod
+    def _head(status: HTTPStatus, headers: dict) -> bytes:
+        lines = [f"HTTP/1.1 {status.value} {status.phrase}"] + [f"{k}: {v}" for k, v in headers.items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def stream(self, job: Job, writer: asyncio.StreamWriter):
+        """Server-sent events: replay the turns so far, then follow the job until it is done"""
+        writer.write(self._head(HTTPStatus.OK, {"Content-Type": "text/event-stream; charset=utf-8",
+                                                "Cache-Control": "no-cache", "Connection": "close"}))
+        queue = asyncio.Queue()
+        backlog = list(job.events)
+        job.subscribers.add(queue)
+        try:
+            for event, data in backlog:
+                writer.write(self._sse(event, data))
+            await writer.drain()
+            if backlog and backlog[-1][0] == "done":
+                return
+            while True:
+                event, data = await queue.get()
+                writer.write(self._sse(event, data))
+                await writer.drain()
+                if event == "done":
+                    return
+        finally:
+            job.subscribers.discard(queue)
+
+    @staticmethod
+    def _sse(event: str, data: dict) -> bytes:
+        payload = json.dumps(data, ensure_ascii=False)
+        return f"event: {event}\ndata: {payload}\n\n".encode("utf-8")
+
+    async def serve(self, host: str, port: int):
+        self.loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Debate service listening on http://{host}:{port} "
+              f"(concurrency={self.concurrency}, max_queue={self.max_queue})")
+        async with server:
+            await server.serve_forever()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser("", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-k", "--api-key", type=str, default=os.environ.get("DEEPSEEK_API_KEY"),
+                        help="API key (default: $DEEPSEEK_API_KEY)")
+    parser.add_argument("-m", "--model-name", type=str, default="deepseek-chat", help="Model name")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Bind address")
+    parser.add_argument("--port", type=int, default=8000, help="Port")
+    parser.add_argument("--concurrency", type=int, default=4, help="Debates running at the same time")
+    parser.add_argument("--max-queue", type=int, default=16, help="Waiting jobs before new ones get 429")
+    parser.add_argument("--deadline", type=float, default=None, help="Latency budget per debate in seconds")
+    parser.add_argument("--call-timeout", type=float, default=None, help="Timeout per API call in seconds")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not args.api_key:
+        raise SystemExit("An API key is required (-k or $DEEPSEEK_API_KEY)")
+    tracing.configure_from_env()
+    service = DebateService(args.api_key, concurrency=args.concurrency, max_queue=args.max_queue,
+                            deadline=args.deadline, call_timeout=args.call_timeout, model_name=args.model_name)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass